@@ -0,0 +1,67 @@
+"""
+Build INT8 YOLO models for edge deployment with post-training quantization.
+
+Usage:
+    python calibrate.py path/to/road_images [--weights yolov8n.pt] [--imgsz 320] [--batch 8] [--device gpu|cpu]
+
+Writes yolov8n_int8.engine (TensorRT, GPU) or yolov8n_int8_openvino_model/
+(OpenVINO + NNCF, CPU). Start the API with STMS_INT8=1 to load it.
+"""
+import argparse
+import os
+import shutil
+
+from ultralytics import YOLO
+
+CALIB_YAML = "calib.yaml"
+
+def write_calib_yaml(images_dir: str, names: dict) -> str:
+    """Describe the calibration images as an Ultralytics dataset (all splits point at them)."""
+    lines = [
+        f"path: {os.path.abspath(images_dir)}",
+        "train: .",
+        "val: .",
+        "names:"
+    ]
+    lines += [f"  {cls}: {name}" for cls, name in names.items()]
+    with open(CALIB_YAML, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return CALIB_YAML
+
+def int8_path(weights: str, device: str) -> str:
+    stem = os.path.splitext(weights)[0]
+    return stem + "_int8.engine" if device == "gpu" else stem + "_int8_openvino_model"
+
+def calibrate(images_dir: str, weights: str, device: str, imgsz: int, batch: int) -> str:
+    model = YOLO(weights)
+    data = write_calib_yaml(images_dir, model.names)
+    fmt = "engine" if device == "gpu" else "openvino"
+    # Dynamic batch up to `batch`: the API's batch worker sends 1..STMS_BATCH frames per call
+    exported = model.export(format=fmt, int8=True, data=data, imgsz=imgsz, batch=batch, dynamic=True)
+
+    # Keep the INT8 artifact next to the FP32/FP16 exports under its own name
+    target = int8_path(weights, device)
+    if os.path.abspath(exported) != os.path.abspath(target):
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        shutil.move(exported, target)
+    return target
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="INT8-calibrate YOLO weights")
+    parser.add_argument("images", help="Directory of representative road images")
+    parser.add_argument("--weights", default="yolov8n.pt")
+    parser.add_argument("--imgsz", type=int, default=320,
+                        help="Input size; must match STMS_IMGSZ of the API (default 320)")
+    parser.add_argument("--batch", type=int, default=int(os.getenv("STMS_BATCH", "8")),
+                        help="Largest batch; must match STMS_BATCH of the API (default 8)")
+    parser.add_argument("--device", choices=["gpu", "cpu"], default=None,
+                        help="Target runtime (default: gpu when CUDA is available)")
+    args = parser.parse_args()
+
+    device = args.device
+    if device is None:
+        import torch
+        device = "gpu" if torch.cuda.is_available() else "cpu"
+
+    print(f"✅ INT8 model written to {calibrate(args.images, args.weights, device, args.imgsz, args.batch)}")
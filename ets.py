@@ -0,0 +1,33 @@
+# ets.py - simple exponential smoothing for short-horizon traffic forecasts
+"""
+Dependency-free forecaster for traffic_prediction.py (TRAFFIC_FORECASTER=ets).
+
+Plain NumPy, no JIT: nothing to compile at worker start, so cold starts are instant.
+The level recursion l_t = alpha * y_t + (1 - alpha) * l_{t-1} runs for a whole grid
+of smoothing factors at once and the one with the smallest one-step error wins.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+ALPHA_GRID = np.linspace(0.05, 0.95, 19)
+
+class EtsModel(NamedTuple):
+    alpha: float
+    level: float
+
+def fit(y: np.ndarray) -> EtsModel:
+    """Pick alpha from ALPHA_GRID by one-step-ahead squared error."""
+    y = np.asarray(y, dtype=np.float64)
+    levels = np.full(len(ALPHA_GRID), y[0])
+    sse = np.zeros(len(ALPHA_GRID))
+    for value in y[1:]:
+        error = value - levels
+        sse += error * error
+        levels += ALPHA_GRID * error
+    best = int(np.argmin(sse))
+    return EtsModel(float(ALPHA_GRID[best]), float(levels[best]))
+
+def forecast(model: EtsModel, h: int) -> np.ndarray:
+    """Forecast h steps (flat at the final level)."""
+    return np.full(h, model.level)
@@ -1,21 +1,30 @@
 # main.py - COMPLETE ENHANCED VERSION WITH MULTI-USER SUPPORT
 import asyncio
 import base64
+import bisect
+import concurrent.futures
 import heapq
 import io
+import os
+import struct
+import time
 from datetime import datetime
 from math import radians, sin, cos, sqrt, atan2
 from typing import List, Tuple, Dict, Optional, Any
 import uuid
-from collections import defaultdict
+from collections import defaultdict, deque
+from functools import lru_cache
 
 import cv2
 import numpy as np
+import orjson
 import pandas as pd
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from ultralytics import YOLO
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 # SAFE import of Prophet (optional). If not installed, predictions will return message.
@@ -25,10 +34,31 @@ try:
 except Exception:
     PROPHET_AVAILABLE = False
 
+# Numba is optional as well; without it the routing kernel runs as plain Python.
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except Exception:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# PyTurboJPEG (libjpeg-turbo) is optional; JPEG frames fall back to cv2.imdecode.
+try:
+    from turbojpeg import TurboJPEG
+    _turbo_jpeg = TurboJPEG()
+    TURBOJPEG_AVAILABLE = True
+except Exception:
+    TURBOJPEG_AVAILABLE = False
+
 # Import your SQLAlchemy model and DB helpers
 # traffic_model.py must define: TrafficData (SQLAlchemy model), SessionLocal(), init_db()
+# and AsyncSessionLocal (None when no async driver is installed)
 try:
-    from traffic_model import TrafficData, SessionLocal, init_db
+    from traffic_model import TrafficData, SessionLocal, AsyncSessionLocal, init_db
 except ImportError:
     # Fallback if traffic_model.py doesn't exist
     print("Warning: traffic_model.py not found. Creating simple in-memory storage.")
@@ -54,17 +84,27 @@ except ImportError:
             return self
         def add(self, *args):
             pass
+        def bulk_save_objects(self, *args):
+            pass
         def commit(self):
             pass
         def close(self):
             pass
     
     SessionLocal = lambda: DummySession()
+    AsyncSessionLocal = None
     
     def init_db():
         pass
 
 # ==================== USER SESSION MANAGEMENT ====================
+SEND_QUEUE_SIZE = 256  # pending outbound messages per WebSocket client
+SEND_BATCH_MAX = 16    # queued messages merged into one frame
+SESSION_SLOTS = 64     # initial capacity of the per-session lane count arrays
+SIGNAL_DEBOUNCE = 0.2  # seconds between signal recomputes triggered by new counts
+MIN_FRAME_INTERVAL = 0.25  # seconds between YOLO runs on one user's /process_frame stream
+COLLECTIVE_CACHE_TTL = 1.0  # seconds a /collective_traffic result may be reused
+
 class UserSession:
     def __init__(self, user_id: str, websocket: WebSocket = None):
         self.user_id = user_id
@@ -74,20 +114,65 @@ class UserSession:
         self.last_active = datetime.utcnow()
         self.detected_vehicles = {"lane_1": 0, "lane_2": 0, "lane_3": 0}
         self.camera_active = False
+        self.last_payload = None  # latest /process_frame response, reused for strided frames
+        self.send_queue: Optional[asyncio.Queue] = None
+        self._sender_task: Optional[asyncio.Task] = None
+    
+    def start_sender(self):
+        """Start the task that owns all writes to this session's WebSocket."""
+        self.send_queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._sender_task = asyncio.create_task(self._sender_loop())
+    
+    def stop_sender(self):
+        if self._sender_task:
+            self._sender_task.cancel()
+            self._sender_task = None
+        self.send_queue = None
+    
+    def enqueue(self, payload: str):
+        """Queue an encoded message without waiting on the socket; dropped if the client is backed up."""
+        if self.send_queue is None:
+            return
+        try:
+            self.send_queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            pass
+    
+    async def _sender_loop(self):
+        queue = self.send_queue
+        try:
+            while True:
+                # Merge whatever backlog built up during the last send into one frame
+                batch = [await queue.get()]
+                while not queue.empty() and len(batch) < SEND_BATCH_MAX:
+                    batch.append(queue.get_nowait())
+                
+                if len(batch) == 1:
+                    await self.websocket.send_text(batch[0])
+                else:
+                    await self.websocket.send_text('{"type":"batch","items":[' + ",".join(batch) + "]}")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket is gone; the receive loop handles the disconnect
+            self.send_queue = None
         
     def update_location(self, lat: float, lng: float):
         self.location = (lat, lng)
         self.last_active = datetime.utcnow()
     
-    def update_vehicles(self, lane_1: int, lane_2: int, lane_3: int):
+    def update_vehicles(self, lane_1: int, lane_2: int, lane_3: int, now: datetime = None):
         self.detected_vehicles = {
             "lane_1": lane_1,
             "lane_2": lane_2,
             "lane_3": lane_3
         }
-        self.last_active = datetime.utcnow()
+        self.last_active = now or datetime.utcnow()
         self.camera_active = True
 
+# Signal fields a signal_delta is keyed on (next_change follows from duration)
+SIGNAL_DELTA_FIELDS = ("status", "duration", "lane")
+
 class SessionManager:
     def __init__(self):
         self.active_sessions: Dict[str, UserSession] = {}
@@ -96,45 +181,153 @@ class SessionManager:
             "signal_2": {"status": "red", "duration": 30, "lane": "lane_2", "next_change": None},
             "signal_3": {"status": "red", "duration": 30, "lane": "lane_3", "next_change": None}
         }
-        self.intersection_data = defaultdict(list)
-        self.collective_traffic_history = []
+        # Bounded histories: deque drops the oldest entry in O(1) once full
+        self.intersection_data = defaultdict(lambda: deque(maxlen=100))
+        self.collective_traffic_history = deque(maxlen=1000)
+        # Lane counts stored per session slot so aggregation is a single array reduction
+        self._lane_counts = np.zeros((SESSION_SLOTS, 3), dtype=np.int32)
+        self._camera_mask = np.zeros(SESSION_SLOTS, dtype=bool)
+        self._camera_count = 0  # number of True entries in _camera_mask
+        # Running per-lane sums over camera sessions, adjusted on every count change
+        self.lane_totals = {"lane_1": 0, "lane_2": 0, "lane_3": 0}
+        self.lane_contributors = {"lane_1": 0, "lane_2": 0, "lane_3": 0}  # sessions with count > 0
+        self._slot_of: Dict[str, int] = {}
+        self._free_slots: List[int] = list(range(SESSION_SLOTS - 1, -1, -1))
+        # Monotonic time of each user's last /process_frame inference
+        self.last_infer_ts: Dict[str, float] = {}
+        # Set when new counts arrive; the signal worker recomputes once per burst
+        self._dirty = asyncio.Event()
+        # Bumped on every session or count change so cached aggregates can tell they are stale
+        self._version = 0
+        # Signals as last sent to clients; later updates only carry what changed since
+        self._last_signals: Dict[str, dict] = {}
         
     async def connect(self, websocket: WebSocket, user_id: str = None):
         if not user_id:
             user_id = f"user_{int(datetime.utcnow().timestamp() * 1000)}_{uuid.uuid4().hex[:8]}"
         session = UserSession(user_id, websocket)
+        self.disconnect(user_id)
         self.active_sessions[user_id] = session
+        self._slot_of[user_id] = self._allocate_slot()
+        self._version += 1
         if websocket:
             await websocket.accept()
+            session.start_sender()
+            # Baseline for the signal_delta messages that follow
+            session.enqueue(encode_message({
+                "type": "signal_update",
+                "signals": self._last_signals or self.traffic_signals,
+                "timestamp": datetime.utcnow()
+            }))
         return user_id
     
     def disconnect(self, user_id: str):
-        if user_id in self.active_sessions:
-            del self.active_sessions[user_id]
+        session = self.active_sessions.pop(user_id, None)
+        if session:
+            session.stop_sender()
+        self.last_infer_ts.pop(user_id, None)
+        slot = self._slot_of.pop(user_id, None)
+        if slot is not None:
+            self._apply_lane_delta(self._lane_counts[slot].tolist(), (0, 0, 0))
+            self._lane_counts[slot] = 0
+            self._camera_count -= int(self._camera_mask[slot])
+            self._camera_mask[slot] = False
+            self._free_slots.append(slot)
+        self._version += 1
+    
+    def _allocate_slot(self) -> int:
+        if not self._free_slots:
+            # Double capacity when every slot is taken
+            capacity = len(self._camera_mask)
+            self._lane_counts = np.vstack([self._lane_counts, np.zeros_like(self._lane_counts)])
+            self._camera_mask = np.concatenate([self._camera_mask, np.zeros(capacity, dtype=bool)])
+            self._free_slots = list(range(2 * capacity - 1, capacity - 1, -1))
+        return self._free_slots.pop()
+    
+    def update_vehicles(self, user_id: str, lane_1: int, lane_2: int, lane_3: int, now: datetime = None):
+        """Record a user's latest per-lane vehicle counts."""
+        self.active_sessions[user_id].update_vehicles(lane_1, lane_2, lane_3, now)
+        slot = self._slot_of[user_id]
+        old = self._lane_counts[slot].tolist()
+        self._lane_counts[slot] = (lane_1, lane_2, lane_3)
+        # Delta from the stored row, so totals always match what the array holds
+        self._apply_lane_delta(old, self._lane_counts[slot].tolist())
+        if not self._camera_mask[slot]:
+            self._camera_mask[slot] = True
+            self._camera_count += 1
+        self._version += 1
+    
+    def _apply_lane_delta(self, old: Tuple[int, int, int], new: Tuple[int, int, int]):
+        for lane, before, after in zip(self.lane_totals, old, new):
+            self.lane_totals[lane] += after - before
+            self.lane_contributors[lane] += (after > 0) - (before > 0)
     
     def get_active_users(self):
         return len(self.active_sessions)
     
     def get_active_cameras(self):
-        return sum(1 for session in self.active_sessions.values() if session.camera_active)
+        return self._camera_count
+    
+    def mark_dirty(self):
+        """Request a debounced signal recompute and broadcast."""
+        self._dirty.set()
+    
+    async def _signal_worker(self):
+        """Recompute signals at most every SIGNAL_DEBOUNCE seconds and broadcast once"""
+        while True:
+            await self._dirty.wait()
+            # Let the rest of the burst land before recomputing
+            await asyncio.sleep(SIGNAL_DEBOUNCE)
+            self._dirty.clear()
+            now = datetime.utcnow()
+            self.calculate_optimal_signal_timing(now)
+            await self.broadcast_signals(
+                now,
+                active_users=self.get_active_users(),
+                active_cameras=self.get_active_cameras()
+            )
+    
+    def signal_message(self, now: datetime, **extra) -> Optional[dict]:
+        """
+        Message announcing the current signals: a full signal_update the first time,
+        then a signal_delta with only signals whose status, duration or lane changed
+        (None when nothing did). next_change moves on every recompute, so it is not
+        compared; clients derive it as the message timestamp plus duration.
+        """
+        signals = self.traffic_signals
+        if signals.keys() != self._last_signals.keys():
+            self.remember_signals()
+            return {"type": "signal_update", "signals": signals, "timestamp": now, **extra}
+        
+        changed = {
+            signal_id: signal for signal_id, signal in signals.items()
+            if any(signal[field] != self._last_signals[signal_id][field] for field in SIGNAL_DELTA_FIELDS)
+        }
+        if not changed:
+            return None
+        self.remember_signals()
+        return {"type": "signal_delta", "changed": changed, "timestamp": now, **extra}
+    
+    def remember_signals(self):
+        """Record the signals clients now have (after any full or delta broadcast)."""
+        self._last_signals = {signal_id: dict(signal) for signal_id, signal in self.traffic_signals.items()}
+    
+    async def broadcast_signals(self, now: datetime, **extra):
+        message = self.signal_message(now, **extra)
+        if message:
+            await broadcast_to_all(message)
     
     def update_intersection_data(self, intersection_id: str, data: dict):
         self.intersection_data[intersection_id].append(data)
-        # Keep only last 100 entries
-        if len(self.intersection_data[intersection_id]) > 100:
-            self.intersection_data[intersection_id] = self.intersection_data[intersection_id][-100:]
     
-    def calculate_optimal_signal_timing(self):
+    def calculate_optimal_signal_timing(self, now: datetime = None):
         """Dynamically adjust traffic signal timing based on collective traffic"""
-        # Aggregate vehicle counts from all users
-        total_vehicles = {"lane_1": 0, "lane_2": 0, "lane_3": 0}
-        active_users = 0
+        # One clock read per recompute, or the caller's request time
+        now = now or datetime.utcnow()
         
-        for session in self.active_sessions.values():
-            if session.camera_active:
-                active_users += 1
-                for lane in total_vehicles:
-                    total_vehicles[lane] += session.detected_vehicles.get(lane, 0)
+        # Aggregate vehicle counts from all users with an active camera
+        active_users = self._camera_count
+        total_vehicles = dict(self.lane_totals)
         
         # If no active cameras, use default timing
         if active_users == 0:
@@ -167,137 +360,246 @@ class SessionManager:
                 signal["status"] = "red"
             
             # Set next change time
-            signal["next_change"] = (datetime.utcnow().timestamp() + duration)
+            signal["next_change"] = round(now.timestamp() + duration, 1)
         
         # Store collective traffic data
         self.collective_traffic_history.append({
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now,
             "traffic": total_vehicles,
             "active_users": active_users,
-            "signals": self.traffic_signals.copy()
+            # Compact (status, duration) per signal; the live signal dicts keep mutating
+            "signals": tuple((signal["status"], signal["duration"]) for signal in self.traffic_signals.values())
         })
         
-        # Keep only last 1000 entries
-        if len(self.collective_traffic_history) > 1000:
-            self.collective_traffic_history = self.collective_traffic_history[-1000:]
-        
         return self.traffic_signals
 
 # Initialize session manager
 session_manager = SessionManager()
 
 # ==================== ROUTE GRAPH CLASSES ====================
+# One bit per lane so a set of lanes to avoid is a single mask
+LANE_BITS = {"lane_1": 1, "lane_2": 2, "lane_3": 4}
+
+@njit(cache=True)
+def _astar(src, dst, indptr, indices, weights, cost, lane_bits, avoid_mask, multiplier, heuristic,
+           distances, previous, visited_gen, gen):
+    """
+    A* over a CSR graph (Dijkstra when heuristic is all zeros).
+    heuristic must never overestimate the remaining cost to dst.
+    distances/previous are reusable buffers whose entries are only valid where
+    visited_gen == gen, so nothing has to be reset between searches.
+    Fills previous (-1 = none) for every node reached in this generation.
+    """
+    distances[src] = 0.0
+    previous[src] = -1
+    visited_gen[src] = gen
+    pq = [(heuristic[src], src)]
+    
+    while len(pq) > 0:
+        priority, current = heapq.heappop(pq)
+        
+        if current == dst:
+            break
+        
+        current_dist = distances[current]
+        if priority > current_dist + heuristic[current]:
+            continue
+        
+        # Skip if this node's lane should be avoided
+        if (lane_bits[current] & avoid_mask) != 0:
+            continue
+        
+        for k in range(indptr[current], indptr[current + 1]):
+            neighbor = indices[k]
+            # Edge length (scaled for alternative routes) weighted by the neighbor's traffic
+            total_cost = current_dist + weights[k] * multiplier * cost[neighbor]
+            
+            if visited_gen[neighbor] != gen or total_cost < distances[neighbor]:
+                visited_gen[neighbor] = gen
+                distances[neighbor] = total_cost
+                previous[neighbor] = current
+                heapq.heappush(pq, (total_cost + heuristic[neighbor], np.int64(neighbor)))
+
 class GraphNode:
-    def __init__(self, lat: float, lng: float, lane_type: str = None):
+    def __init__(self, node_id: str, lat: float, lng: float, lane_type: str = None):
+        self.node_id = node_id
         self.lat = lat
         self.lng = lng
         self.lane_type = lane_type
+        self.lane_bit = LANE_BITS.get(lane_type, 0)
         self.edges = []
         self.traffic_cost = 1.0  # Default cost
     
-    def add_edge(self, node, weight: float):
-        self.edges.append((node, weight))
+    def add_edge(self, node_id: str, weight: float):
+        self.edges.append((node_id, weight))
 
 class RoadGraph:
     def __init__(self):
         self.nodes = {}
         self.lane_traffic = {"lane_1": 1.0, "lane_2": 1.0, "lane_3": 1.0}
+        # Integer-indexed view of the graph, rebuilt lazily after add_node/add_edge:
+        # packed coordinates, CSR adjacency and per-node traffic cost
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._lats: np.ndarray = np.empty(0, dtype=np.float64)
+        self._lngs: np.ndarray = np.empty(0, dtype=np.float64)
+        self._lane_bits: np.ndarray = np.empty(0, dtype=np.uint8)
+        self._indptr: np.ndarray = np.zeros(1, dtype=np.int32)
+        self._indices: np.ndarray = np.empty(0, dtype=np.int32)
+        self._weights: np.ndarray = np.empty(0, dtype=np.float32)
+        self._traffic_cost: np.ndarray = np.empty(0, dtype=np.float64)
+        # Search buffers reused across routes, lazily reset via a generation counter
+        self._distances: np.ndarray = np.empty(0, dtype=np.float64)
+        self._previous: np.ndarray = np.empty(0, dtype=np.int32)
+        self._visited_gen: np.ndarray = np.empty(0, dtype=np.int32)
+        self._search_gen = 0
+        self._index_dirty = False
+        # Nodes of each lane kept sorted by (lat, lng) for /road_network
+        self.lane_groups: Dict[str, List[GraphNode]] = {}
+        # Routes are memoized per traffic version; bumping the version invalidates them
+        self._traffic_version = 0
+        self._find_route_cached = lru_cache(maxsize=4096)(self._find_route_uncached)
     
     def add_node(self, node_id: str, lat: float, lng: float, lane_type: str = None):
-        self.nodes[node_id] = GraphNode(lat, lng, lane_type)
+        if node_id not in self.nodes:
+            self._index[node_id] = len(self._ids)
+            self._ids.append(node_id)
+        elif self.nodes[node_id].lane_type:
+            self.lane_groups[self.nodes[node_id].lane_type].remove(self.nodes[node_id])
+        node = GraphNode(node_id, lat, lng, lane_type)
+        self.nodes[node_id] = node
+        if lane_type:
+            bisect.insort(self.lane_groups.setdefault(lane_type, []), node, key=lambda n: (n.lat, n.lng))
+        self._index_dirty = True
+        self._find_route_cached.cache_clear()
     
     def add_edge(self, node1_id: str, node2_id: str, distance: float):
         if node1_id in self.nodes and node2_id in self.nodes:
-            self.nodes[node1_id].add_edge(self.nodes[node2_id], distance)
-            self.nodes[node2_id].add_edge(self.nodes[node1_id], distance)
+            self.nodes[node1_id].add_edge(node2_id, distance)
+            self.nodes[node2_id].add_edge(node1_id, distance)
+            self._index_dirty = True
+            self._find_route_cached.cache_clear()
+    
+    def _ensure_index(self):
+        if not self._index_dirty:
+            return
+        
+        nodes = [self.nodes[node_id] for node_id in self._ids]
+        self._lats = np.array([node.lat for node in nodes], dtype=np.float64)
+        self._lngs = np.array([node.lng for node in nodes], dtype=np.float64)
+        self._lane_bits = np.array([node.lane_bit for node in nodes], dtype=np.uint8)
+        self._traffic_cost = np.array([node.traffic_cost for node in nodes], dtype=np.float64)
+        self._distances = np.empty(len(nodes), dtype=np.float64)
+        self._previous = np.empty(len(nodes), dtype=np.int32)
+        self._visited_gen = np.zeros(len(nodes), dtype=np.int32)
+        self._search_gen = 0
+        
+        # CSR adjacency: each node's edges are contiguous, in node order
+        self._indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+        np.cumsum([len(node.edges) for node in nodes], out=self._indptr[1:])
+        self._indices = np.array(
+            [self._index[neighbor_id] for node in nodes for neighbor_id, _ in node.edges],
+            dtype=np.int32
+        )
+        # Edge geometry never changes; float32 halves the bytes the search streams through
+        self._weights = np.array(
+            [distance for node in nodes for _, distance in node.edges],
+            dtype=np.float32
+        )
+        
+        self._index_dirty = False
     
     def update_traffic(self, lane_1: int, lane_2: int, lane_3: int):
         # Convert vehicle count to traffic cost (higher count = higher cost)
         max_traffic = max(lane_1, lane_2, lane_3, 1)
-        self.lane_traffic = {
+        lane_traffic = {
             "lane_1": 1.0 + (lane_1 / max_traffic) * 2.0,
             "lane_2": 1.0 + (lane_2 / max_traffic) * 2.0,
             "lane_3": 1.0 + (lane_3 / max_traffic) * 2.0
         }
+        if lane_traffic == self.lane_traffic:
+            return
+        self.lane_traffic = lane_traffic
+        self._traffic_version += 1
         
         # Update node costs based on lane type
         for node in self.nodes.values():
             if node.lane_type in self.lane_traffic:
                 node.traffic_cost = self.lane_traffic[node.lane_type]
+        
+        # Mirror into the routing cost array in place (no CSR rebuild)
+        self._ensure_index()
+        bit_costs = np.zeros(max(LANE_BITS.values()) + 1, dtype=np.float64)
+        for lane, bit in LANE_BITS.items():
+            bit_costs[bit] = self.lane_traffic[lane]
+        on_lane = self._lane_bits != 0
+        self._traffic_cost[on_lane] = bit_costs[self._lane_bits[on_lane]]
     
     def find_route(self, start_lat: float, start_lng: float, 
                    end_lat: float, end_lng: float, avoid_lanes: List[str] = None,
                    max_distance_multiplier: float = 1.0) -> List[Tuple[float, float]]:
+        # Quantize endpoints to ~11m so nearby repeat queries share a cache entry
+        path = self._find_route_cached(
+            (round(start_lat, 4), round(start_lng, 4)),
+            (round(end_lat, 4), round(end_lng, 4)),
+            tuple(sorted(set(avoid_lanes or []))),
+            float(max_distance_multiplier),
+            self._traffic_version
+        )
+        return list(path)
+    
+    def _find_route_uncached(self, start: Tuple[float, float], end: Tuple[float, float],
+                             avoid_lanes: Tuple[str, ...], max_distance_multiplier: float,
+                             traffic_version: int) -> Tuple[Tuple[float, float], ...]:
+        start_lat, start_lng = start
+        end_lat, end_lng = end
+        
         # Find nearest nodes to start and end
         start_node = self._find_nearest_node(start_lat, start_lng)
         end_node = self._find_nearest_node(end_lat, end_lng)
         
         if not start_node or not end_node:
-            return []
-        
-        # Dijkstra's algorithm with traffic consideration
-        distances = {node_id: float('inf') for node_id in self.nodes}
-        distances[start_node] = 0
-        previous = {node_id: None for node_id in self.nodes}
-        pq = [(0, start_node)]
-        
-        while pq:
-            current_dist, current_id = heapq.heappop(pq)
-            
-            if current_id == end_node:
-                break
-            
-            if current_dist > distances[current_id]:
-                continue
-            
-            current_node = self.nodes[current_id]
-            
-            # Skip if this node's lane should be avoided
-            if avoid_lanes and current_node.lane_type in avoid_lanes:
-                continue
-            
-            for neighbor, base_distance in current_node.edges:
-                neighbor_id = self._get_node_id(neighbor)
-                
-                # Apply distance multiplier for alternative routes
-                adjusted_distance = base_distance * max_distance_multiplier
-                
-                # Calculate cost considering traffic
-                traffic_multiplier = neighbor.traffic_cost
-                total_cost = current_dist + (adjusted_distance * traffic_multiplier)
-                
-                if total_cost < distances[neighbor_id]:
-                    distances[neighbor_id] = total_cost
-                    previous[neighbor_id] = current_id
-                    heapq.heappush(pq, (total_cost, neighbor_id))
+            return ()
+        
+        avoid_mask = np.uint8(sum(LANE_BITS.get(lane, 0) for lane in avoid_lanes))
+        
+        # A* with traffic consideration. Edge lengths are never shorter than the
+        # great-circle distance and traffic costs are at least the cheapest lane,
+        # so straight-line distance to the target scaled by both is admissible.
+        end = self._index[end_node]
+        heuristic = haversine_batch(self._lats, self._lngs, self._lats[end], self._lngs[end])
+        heuristic *= max_distance_multiplier * self._traffic_cost.min()
+        self._search_gen += 1
+        if self._search_gen == np.iinfo(np.int32).max:
+            self._visited_gen.fill(0)
+            self._search_gen = 1
+        _astar(
+            self._index[start_node], end,
+            self._indptr, self._indices, self._weights, self._traffic_cost,
+            self._lane_bits, avoid_mask, max_distance_multiplier, heuristic,
+            self._distances, self._previous, self._visited_gen, self._search_gen
+        )
         
-        # Reconstruct path
+        # Reconstruct path (just the end node when it was never reached)
         path = []
-        current = end_node
-        while current:
-            node = self.nodes[current]
+        current = end
+        while current != -1:
+            node = self.nodes[self._ids[current]]
             path.append((node.lat, node.lng))
-            current = previous[current]
+            if self._visited_gen[current] != self._search_gen:
+                break
+            current = self._previous[current]
         
-        return list(reversed(path))
+        return tuple(reversed(path))
     
     def _find_nearest_node(self, lat: float, lng: float) -> str:
-        min_distance = float('inf')
-        nearest = None
-        
-        for node_id, node in self.nodes.items():
-            distance = ((node.lat - lat) ** 2 + (node.lng - lng) ** 2) ** 0.5
-            if distance < min_distance:
-                min_distance = distance
-                nearest = node_id
+        if not self._ids:
+            return None
         
-        return nearest
-    
-    def _get_node_id(self, node: GraphNode) -> str:
-        for node_id, n in self.nodes.items():
-            if n == node:
-                return node_id
-        return None
+        self._ensure_index()
+        dx = self._lats - lat
+        dy = self._lngs - lng
+        return self._ids[int(np.argmin(dx * dx + dy * dy))]
 
 # ==================== HELPER FUNCTIONS ====================
 def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
@@ -314,6 +616,27 @@ def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> fl
     
     return R * c
 
+def haversine_batch(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Vectorized Haversine distance in meters for arrays of coordinate pairs."""
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    delta_lat = lat2_rad - lat1_rad
+    delta_lng = np.radians(np.subtract(lng2, lng1))
+    
+    a = np.sin(delta_lat/2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(delta_lng/2)**2
+    return 6371000 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+def calculate_path_distance(path: List[Tuple[float, float]]) -> float:
+    """Total length in meters of a (lat, lng) polyline."""
+    if len(path) < 2:
+        return 0.0
+    coords = np.asarray(path, dtype=np.float64)
+    return float(haversine_batch(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1]).sum())
+
+def path_points(path: List[Tuple[float, float]]) -> List[dict]:
+    """A (lat, lng) polyline as response points, rounded to 5 decimals (~1 m)."""
+    return [{"lat": round(lat, 5), "lng": round(lng, 5)} for lat, lng in path]
+
 def get_average_speed(lanes: dict) -> float:
     """Calculate average speed based on traffic density."""
     total_vehicles = sum(lanes.values())
@@ -367,50 +690,96 @@ def initialize_road_network():
         for node_id, lat, lng in road["nodes"]:
             road_graph.add_node(node_id, lat, lng, road["lane"])
     
-    # Connect nodes within each road
-    for road_id, road in roads.items():
-        nodes = road["nodes"]
-        for i in range(len(nodes) - 1):
-            node1_id, lat1, lng1 = nodes[i]
-            node2_id, lat2, lng2 = nodes[i + 1]
-            # Calculate approximate distance (simplified)
-            distance = ((lat2 - lat1) ** 2 + (lng2 - lng1) ** 2) ** 0.5 * 111000  # meters
-            road_graph.add_edge(node1_id, node2_id, distance)
+    # Connect nodes within each road: consecutive pairs of every road, measured
+    # with a single Haversine call (meters)
+    segments = [
+        (node1, node2)
+        for road in roads.values()
+        for node1, node2 in zip(road["nodes"][:-1], road["nodes"][1:])
+    ]
+    starts = np.array([(lat, lng) for (_, lat, lng), _ in segments], dtype=np.float64)
+    ends = np.array([(lat, lng) for _, (_, lat, lng) in segments], dtype=np.float64)
+    distances = haversine_batch(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]).astype(np.float32)
+    for ((node1_id, _, _), (node2_id, _, _)), distance in zip(segments, distances):
+        road_graph.add_edge(node1_id, node2_id, float(distance))
     
     # Connect intersecting roads
     road_graph.add_edge("rd1_d", "rd2_a", 500)  # Majestic ↔ City Center
     road_graph.add_edge("rd1_h", "rd3_a", 300)  # Majestic ↔ Tech Park
 
+# numpy scalars/arrays pass straight through; naive datetimes are utcnow() values, so tag them UTC
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
+
+def encode_message(message: dict) -> str:
+    """Serialize a WebSocket message once so every recipient shares the same text."""
+    return orjson.dumps(message, option=ORJSON_OPTIONS).decode()
+
 async def broadcast_to_all(message: dict):
-    """Broadcast message to all connected users via WebSocket."""
-    disconnected = []
-    
-    for user_id, session in session_manager.active_sessions.items():
-        if session.websocket:
-            try:
-                await session.websocket.send_json(message)
-            except:
-                disconnected.append(user_id)
-    
-    for user_id in disconnected:
-        session_manager.disconnect(user_id)
+    """Broadcast message to all connected users via their send queues."""
+    payload = encode_message(message)
+    for session in session_manager.active_sessions.values():
+        session.enqueue(payload)
+
+def broadcast_traffic(data: dict):
+    """Broadcast JSON to all /ws/traffic clients via their send queues; never waits."""
+    payload = encode_message(data)
+    for client in list(clients.values()):
+        client.enqueue(payload)
+
+# ==================== BUFFERED DATABASE WRITES ====================
+TRAFFIC_FLUSH_INTERVAL = 0.5  # seconds between batched inserts
+_traffic_buffer: List[TrafficData] = []
+# Serializes flushes so the periodic task and shutdown never commit concurrently
+_flush_lock = asyncio.Lock()
+
+def _save_traffic_rows(rows: List[TrafficData]):
+    """Insert a batch of traffic rows in a single transaction."""
+    db: Session = SessionLocal()
+    try:
+        db.bulk_save_objects(rows)
+        db.commit()
+    finally:
+        db.close()
 
-async def broadcast_traffic(data: dict):
-    """Safely broadcast JSON to all connected clients."""
-    to_remove = []
-    for ws in clients:
-        try:
-            await ws.send_json(data)
-        except Exception:
-            to_remove.append(ws)
-    for ws in to_remove:
+async def flush_traffic_buffer():
+    """Write all buffered traffic rows to the database."""
+    global _traffic_buffer
+    if not _traffic_buffer:
+        return
+    async with _flush_lock:
+        rows, _traffic_buffer = _traffic_buffer, []
+        if not rows:
+            return
         try:
-            clients.remove(ws)
-        except ValueError:
-            pass
+            await asyncio.to_thread(_save_traffic_rows, rows)
+        except Exception as e:
+            print(f"Error flushing traffic data: {e}")
+
+def _query_latest_traffic(limit: int) -> List[TrafficData]:
+    db: Session = SessionLocal()
+    try:
+        return db.query(TrafficData).order_by(TrafficData.id.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+async def fetch_latest_traffic(limit: int) -> List[TrafficData]:
+    """Newest committed rows, queried without blocking the event loop."""
+    if AsyncSessionLocal is None:
+        return await asyncio.to_thread(_query_latest_traffic, limit)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(TrafficData).order_by(TrafficData.id.desc()).limit(limit))
+        return list(result.scalars())
+
+async def recent_traffic_rows(limit: int) -> List[TrafficData]:
+    """Newest traffic rows first, including rows still waiting in the write buffer."""
+    rows = _traffic_buffer[::-1][:limit]
+    if len(rows) < limit:
+        rows += await fetch_latest_traffic(limit - len(rows))
+    return rows
 
 # ==================== FASTAPI APP INIT ====================
-app = FastAPI(title="Smart Traffic Management System API")
+# orjson serializes responses (including raw datetime values) natively
+app = FastAPI(title="Smart Traffic Management System API", default_response_class=ORJSONResponse)
 init_db()
 
 app.add_middleware(
@@ -422,19 +791,185 @@ app.add_middleware(
 )
 
 # ==================== LOAD YOLO MODEL ====================
+YOLO_WEIGHTS = "yolov8n.pt"  # ensure this path is correct
+# "pt" runs the PyTorch weights; "onnx" runs an INT8-quantized ONNX export on ONNX Runtime;
+# "openvino" (CPU) and "engine" (TensorRT FP16, GPU) run exported models;
+# "auto" picks TensorRT when CUDA is available and OpenVINO otherwise
+MODEL_FORMAT = os.getenv("STMS_MODEL_FORMAT", "pt").lower()
+# STMS_INT8=1 loads the PTQ model built by calibrate.py instead
+USE_INT8 = os.getenv("STMS_INT8") == "1"
+# Inference resolution; lane counting does not need 640px and compute scales with its square
+YOLO_IMGSZ = int(os.getenv("STMS_IMGSZ", "320"))
+# Most frames per YOLO forward pass; exported models are built to accept batches this large
+INFER_BATCH_MAX = int(os.getenv("STMS_BATCH", "8"))
+
+def export_onnx_int8(weights: str) -> str:
+    """Export weights to ONNX and quantize them to INT8 once; later starts reuse the file."""
+    int8_path = os.path.splitext(weights)[0] + "_int8.onnx"
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        fp32_path = YOLO(weights).export(format="onnx", dynamic=True)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8)
+    return int8_path
+
+def export_runtime_model(weights: str, fmt: str) -> str:
+    """
+    Export weights to an OpenVINO or TensorRT model once; later starts reuse it.
+    The batch dimension is dynamic up to INFER_BATCH_MAX, since yolo_batch_worker
+    sends anywhere from one frame to a full batch.
+    """
+    stem = os.path.splitext(weights)[0]
+    path = stem + ".engine" if fmt == "engine" else stem + "_openvino_model"
+    if not os.path.exists(path):
+        path = YOLO(weights).export(
+            format=fmt, half=(fmt == "engine"), imgsz=YOLO_IMGSZ,
+            batch=INFER_BATCH_MAX, dynamic=True
+        )
+    return path
+
+def cuda_available() -> bool:
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+def load_yolo_model():
+    """Load the detector in the configured format; the Ultralytics wrapper keeps results identical."""
+    if USE_INT8:
+        stem = os.path.splitext(YOLO_WEIGHTS)[0]
+        int8_path = stem + "_int8.engine" if cuda_available() else stem + "_int8_openvino_model"
+        if os.path.exists(int8_path):
+            return YOLO(int8_path, task="detect")
+        print(f"INT8 model {int8_path} not found; run calibrate.py to build it")
+    
+    fmt = MODEL_FORMAT
+    if fmt == "auto":
+        fmt = "engine" if cuda_available() else "openvino"
+    try:
+        if fmt == "onnx":
+            return YOLO(export_onnx_int8(YOLO_WEIGHTS), task="detect")
+        if fmt in ("openvino", "engine"):
+            return YOLO(export_runtime_model(YOLO_WEIGHTS, fmt), task="detect")
+    except Exception as e:
+        print(f"{fmt} model unavailable, using PyTorch weights: {e}")
+    return YOLO(YOLO_WEIGHTS)
+
 try:
-    model = YOLO("yolov8n.pt")  # ensure this path is correct
+    model = load_yolo_model()
     print("YOLO model loaded successfully")
 except Exception as e:
     print(f"Error loading YOLO model: {e}")
     model = None
 
+# Class ids for each label counted by /process_frame_form, resolved once so
+# per-frame counting is a single bincount
+FORM_COUNT_LABELS = {
+    "cars": "car",
+    "buses": "bus",
+    "trucks": "truck",
+    "motorcycles": "motorcycle",
+    "bicycles": "bicycle",
+    "persons": "person"
+}
+
+NUM_CLASSES = max(model.names) + 1 if model else 0
+# Lowercased class name per class id, computed once ("" for unused ids)
+CLASS_NAMES_LC = np.array(
+    [model.names.get(cls, "").lower() for cls in range(NUM_CLASSES)] if model else [],
+    dtype=object
+)
+
+def class_ids_for(label: str) -> np.ndarray:
+    return np.flatnonzero(CLASS_NAMES_LC == label).astype(np.intp)
+
+FORM_CLASS_IDS = {key: class_ids_for(label) for key, label in FORM_COUNT_LABELS.items()}
+AMBULANCE_CLASS_IDS = class_ids_for("ambulance")
+
+# ==================== BATCHED INFERENCE ====================
+BATCH_WAIT_MS = 20   # how long a partial batch waits for more frames
+_infer_queue: asyncio.Queue = asyncio.Queue()
+# Inference runs here so CPU-bound YOLO calls never block the event loop
+inference_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="yolo")
+
+def run_model(source):
+    """Run YOLO at the configured inference resolution (letterboxed, so boxes stay in frame pixels)."""
+    return model(source, imgsz=YOLO_IMGSZ, verbose=False)
+
+def warmup_model(runs: int = 3):
+    """Run dummy frames through YOLO so the first real request skips cold-start setup."""
+    if model is None:
+        return
+    dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+    try:
+        for _ in range(runs):
+            run_model(dummy)
+    except Exception as e:
+        print(f"YOLO warm-up failed: {e}")
+
+async def yolo_batch_worker():
+    """Run queued frames through YOLO together, one forward pass per batch."""
+    while True:
+        items = [await _infer_queue.get()]
+        # Give frames from other users a short window to join a partial batch
+        if _infer_queue.qsize() < INFER_BATCH_MAX - 1:
+            await asyncio.sleep(BATCH_WAIT_MS / 1000)
+        while not _infer_queue.empty() and len(items) < INFER_BATCH_MAX:
+            items.append(_infer_queue.get_nowait())
+        
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                inference_pool, run_model, [img for img, _ in items]
+            )
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+async def detect_batched(img_np: np.ndarray):
+    """Queue a frame for batched YOLO inference and wait for its result."""
+    future = asyncio.get_running_loop().create_future()
+    await _infer_queue.put((img_np, future))
+    return await future
+
 # ==================== INITIALIZE ROAD GRAPH ====================
 road_graph = RoadGraph()
 initialize_road_network()
 
 # ==================== WEBSOCKET CLIENTS ====================
-clients: list[WebSocket] = []
+class TrafficClient:
+    """A /ws/traffic subscriber with its own bounded send queue and sender task."""
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.send_queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._sender_task = asyncio.create_task(self._sender_loop())
+    
+    def enqueue(self, payload: str):
+        """Queue an encoded message; dropped if the client is backed up."""
+        try:
+            self.send_queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            pass
+    
+    def close(self):
+        self._sender_task.cancel()
+    
+    async def _sender_loop(self):
+        try:
+            while True:
+                await self.websocket.send_text(await self.send_queue.get())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket is gone; stop fanning out to it
+            clients.pop(self.websocket, None)
+
+clients: Dict[WebSocket, TrafficClient] = {}
 
 # ==================== REQUEST SCHEMAS ====================
 class FrameData(BaseModel):
@@ -515,7 +1050,7 @@ async def get_available_cameras():
         "cameras": cameras,
         "active_users": active_users,
         "active_cameras": active_cameras,
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "success": True
     }
 
@@ -534,6 +1069,8 @@ async def submit_traffic(request: SubmitTrafficRequest):
         user_id = request.user_id
         camera_id = request.camera_id
         
+        now = datetime.utcnow()
+        
         # Update road graph with current traffic
         road_graph.update_traffic(lane_1, lane_2, lane_3)
         
@@ -543,34 +1080,21 @@ async def submit_traffic(request: SubmitTrafficRequest):
             if user_id not in session_manager.active_sessions:
                 await session_manager.connect(None, user_id)
             
-            session_manager.active_sessions[user_id].update_vehicles(
-                lane_1, lane_2, lane_3
+            session_manager.update_vehicles(
+                user_id, lane_1, lane_2, lane_3, now
             )
             
-            # Recalculate signals with new data
-            signals = session_manager.calculate_optimal_signal_timing()
-            
-            # Broadcast signal update
-            await broadcast_to_all({
-                "type": "signal_update",
-                "signals": signals,
-                "active_users": session_manager.get_active_users(),
-                "active_cameras": session_manager.get_active_cameras(),
-                "timestamp": datetime.utcnow().isoformat()
-            })
+            # Signals are recomputed and broadcast by the debounced signal worker
+            session_manager.mark_dirty()
         
-        # Save to database
-        db: Session = SessionLocal()
-        entry = TrafficData(
+        # Queue for the next batched database write
+        _traffic_buffer.append(TrafficData(
             lane_1=lane_1,
             lane_2=lane_2,
             lane_3=lane_3,
             ambulance_detected=ambulance_detected,
-            timestamp=datetime.utcnow()
-        )
-        db.add(entry)
-        db.commit()
-        db.close()
+            timestamp=now
+        ))
         
         # Prepare response
         payload = {
@@ -586,11 +1110,11 @@ async def submit_traffic(request: SubmitTrafficRequest):
             },
             "user_id": user_id,
             "camera_id": camera_id,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": now
         }
         
         # Broadcast via WebSocket
-        await broadcast_traffic({
+        broadcast_traffic({
             "type": "traffic_update",
             **payload
         })
@@ -601,6 +1125,121 @@ async def submit_traffic(request: SubmitTrafficRequest):
         print(f"Error in submit_traffic: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def decode_image(data: bytes) -> Optional[np.ndarray]:
+    """Decode an encoded image to BGR; JPEGs go through libjpeg-turbo when available."""
+    if TURBOJPEG_AVAILABLE and data[:2] == b"\xff\xd8":
+        try:
+            return _turbo_jpeg.decode(data)
+        except Exception:
+            pass  # Corrupt or unusual JPEG: let OpenCV try
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+# Raw frame wire format for /ws/frames: little-endian header, then uncompressed pixels
+RAW_FRAME_HEADER = struct.Struct("<HHI")  # width, height, pixel format
+RAW_FORMAT_BGR = 0
+RAW_FORMAT_RGB = 1
+RAW_FORMAT_I420 = 2  # planar YUV 4:2:0, width * height * 3 / 2 bytes
+
+def decode_raw_frame(data: bytes) -> Optional[np.ndarray]:
+    """Wrap a raw frame message as a BGR image without any JPEG decoding."""
+    if len(data) < RAW_FRAME_HEADER.size:
+        return None
+    width, height, pixel_format = RAW_FRAME_HEADER.unpack_from(data)
+    pixels = np.frombuffer(data, np.uint8, offset=RAW_FRAME_HEADER.size)
+    
+    if pixel_format in (RAW_FORMAT_BGR, RAW_FORMAT_RGB):
+        if pixels.size != width * height * 3:
+            return None
+        img = pixels.reshape(height, width, 3)
+        return img if pixel_format == RAW_FORMAT_BGR else cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    
+    if pixel_format == RAW_FORMAT_I420:
+        if height % 2 or width % 2 or pixels.size != width * height * 3 // 2:
+            return None
+        return cv2.cvtColor(pixels.reshape(height * 3 // 2, width), cv2.COLOR_YUV2BGR_I420)
+    
+    return None
+
+async def analyze_camera_frame(img_np: np.ndarray, user_id: Optional[str], camera_id: Optional[str]) -> dict:
+    """
+    Detect vehicles in a decoded BGR frame, update sessions/signals and broadcast.
+    Shared by /process_frame_form and the raw /ws/frames stream.
+    """
+    now = datetime.utcnow()
+    
+    # Run YOLO detection (batched with other concurrent uploads)
+    results = [await detect_batched(img_np)]
+    
+    # Vehicle classification: one histogram over all detected class ids
+    cls_arr = results[0].boxes.cls.cpu().numpy().astype(int)
+    class_counts = np.bincount(cls_arr, minlength=NUM_CLASSES)
+    vehicle_counts = {key: int(class_counts[ids].sum()) for key, ids in FORM_CLASS_IDS.items()}
+    ambulance_detected = bool(class_counts[AMBULANCE_CLASS_IDS].any())
+    
+    # Calculate lane distribution (simplified logic)
+    total_vehicles = vehicle_counts["cars"] + vehicle_counts["buses"] + vehicle_counts["trucks"]
+    lane1 = int(total_vehicles * 0.4) if total_vehicles > 0 else 0
+    lane2 = int(total_vehicles * 0.3) if total_vehicles > 0 else 0
+    lane3 = max(0, total_vehicles - lane1 - lane2)
+    
+    # Update user session
+    if user_id:
+        # Create session if it doesn't exist
+        if user_id not in session_manager.active_sessions:
+            await session_manager.connect(None, user_id)
+        
+        session_manager.update_vehicles(user_id, lane1, lane2, lane3, now)
+    
+    # Update road graph
+    road_graph.update_traffic(lane1, lane2, lane3)
+    
+    # Calculate optimal signals
+    signals = session_manager.calculate_optimal_signal_timing(now)
+    
+    # Prepare heatmap data
+    heatmap_points = []
+    if total_vehicles > 0:
+        # Generate heatmap points based on traffic density
+        for i in range(min(10, total_vehicles)):
+            heatmap_points.append({
+                "x": 20 + (i * 8),  # Percentage across screen
+                "y": 30 + (i * 4),   # Percentage down screen
+                "intensity": min(10, lane1 + lane2 + lane3),
+                "radius": 15 + (i * 2),
+                "lane": "lane_1" if i < 3 else "lane_2" if i < 6 else "lane_3"
+            })
+    
+    # Prepare response matching CameraFeed.js expectations
+    response = {
+        "success": True,
+        "vehicles": vehicle_counts,
+        "traffic_data": {
+            "lane1": lane1,
+            "lane2": lane2,
+            "lane3": lane3,
+            "congestion": get_congestion_level(total_vehicles),
+            "signalStatus": "Green" if signals["signal_1"]["status"] == "green" else "Red"
+        },
+        "heatmap": heatmap_points,
+        "total_vehicles": total_vehicles,
+        "ambulance_detected": ambulance_detected,
+        "congestion_level": get_congestion_level(total_vehicles),
+        "traffic_signals": signals,
+        "user_id": user_id,
+        "camera_id": camera_id,
+        "timestamp": now
+    }
+    
+    # Broadcast update to all WebSocket clients
+    await broadcast_to_all({
+        "type": "vehicle_detection",
+        **response
+    })
+    
+    return response
+
 @app.post("/process_frame_form")
 async def process_frame_form(
     image: UploadFile = File(...),
@@ -620,114 +1259,12 @@ async def process_frame_form(
         
         # Read image file
         contents = await image.read()
-        np_arr = np.frombuffer(contents, np.uint8)
-        img_np = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        img_np = await asyncio.to_thread(decode_image, contents)
         
         if img_np is None:
             return {"error": "Could not decode image", "success": False}
         
-        # Run YOLO detection
-        results = model(img_np)
-        
-        h, w, _ = img_np.shape
-        L1 = w // 3
-        L2 = 2 * (w // 3)
-        
-        # Vehicle classification
-        vehicle_counts = {
-            "cars": 0, 
-            "buses": 0, 
-            "trucks": 0, 
-            "motorcycles": 0,
-            "bicycles": 0,
-            "persons": 0
-        }
-        ambulance_detected = False
-        
-        for box in results[0].boxes:
-            cls = int(box.cls[0])
-            label = model.names[cls].lower()
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            mid_x = (x1 + x2) // 2
-            
-            # Count vehicles
-            if label == "car":
-                vehicle_counts["cars"] += 1
-            elif label == "bus":
-                vehicle_counts["buses"] += 1
-            elif label == "truck":
-                vehicle_counts["trucks"] += 1
-            elif label == "motorcycle":
-                vehicle_counts["motorcycles"] += 1
-            elif label == "bicycle":
-                vehicle_counts["bicycles"] += 1
-            elif label == "person":
-                vehicle_counts["persons"] += 1
-            elif label == "ambulance":
-                ambulance_detected = True
-        
-        # Calculate lane distribution (simplified logic)
-        total_vehicles = vehicle_counts["cars"] + vehicle_counts["buses"] + vehicle_counts["trucks"]
-        lane1 = int(total_vehicles * 0.4) if total_vehicles > 0 else 0
-        lane2 = int(total_vehicles * 0.3) if total_vehicles > 0 else 0
-        lane3 = max(0, total_vehicles - lane1 - lane2)
-        
-        # Update user session
-        if user_id:
-            # Create session if it doesn't exist
-            if user_id not in session_manager.active_sessions:
-                await session_manager.connect(None, user_id)
-            
-            session_manager.active_sessions[user_id].update_vehicles(lane1, lane2, lane3)
-            session_manager.active_sessions[user_id].camera_active = True
-        
-        # Update road graph
-        road_graph.update_traffic(lane1, lane2, lane3)
-        
-        # Calculate optimal signals
-        signals = session_manager.calculate_optimal_signal_timing()
-        
-        # Prepare heatmap data
-        heatmap_points = []
-        if total_vehicles > 0:
-            # Generate heatmap points based on traffic density
-            for i in range(min(10, total_vehicles)):
-                heatmap_points.append({
-                    "x": 20 + (i * 8),  # Percentage across screen
-                    "y": 30 + (i * 4),   # Percentage down screen
-                    "intensity": min(10, lane1 + lane2 + lane3),
-                    "radius": 15 + (i * 2),
-                    "lane": "lane_1" if i < 3 else "lane_2" if i < 6 else "lane_3"
-                })
-        
-        # Prepare response matching CameraFeed.js expectations
-        response = {
-            "success": True,
-            "vehicles": vehicle_counts,
-            "traffic_data": {
-                "lane1": lane1,
-                "lane2": lane2,
-                "lane3": lane3,
-                "congestion": get_congestion_level(total_vehicles),
-                "signalStatus": "Green" if signals["signal_1"]["status"] == "green" else "Red"
-            },
-            "heatmap": heatmap_points,
-            "total_vehicles": total_vehicles,
-            "ambulance_detected": ambulance_detected,
-            "congestion_level": get_congestion_level(total_vehicles),
-            "traffic_signals": signals,
-            "user_id": user_id,
-            "camera_id": camera_id,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        # Broadcast update to all WebSocket clients
-        await broadcast_to_all({
-            "type": "vehicle_detection",
-            **response
-        })
-        
-        return response
+        return await analyze_camera_frame(img_np, user_id, camera_id)
         
     except Exception as e:
         print(f"Error in process_frame_form: {str(e)}")
@@ -759,7 +1296,7 @@ async def get_traffic_heatmap():
     return {
         "heatmap": heatmap_points,
         "total_intensity": sum(point["intensity"] for point in heatmap_points),
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "success": True
     }
 
@@ -784,7 +1321,7 @@ async def get_system_status():
             ),
             "signal_optimizations": len(session_manager.collective_traffic_history)
         },
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "success": True
     }
 
@@ -793,17 +1330,17 @@ async def get_system_status():
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket for general traffic updates."""
     await websocket.accept()
-    clients.append(websocket)
+    clients[websocket] = TrafficClient(websocket)
     try:
         while True:
             # Keep connection alive
             await websocket.receive_text()
-    except WebSocketDisconnect:
-        if websocket in clients:
-            clients.remove(websocket)
     except Exception:
-        if websocket in clients:
-            clients.remove(websocket)
+        pass
+    finally:
+        client = clients.pop(websocket, None)
+        if client:
+            client.close()
 
 @app.websocket("/ws/user")
 async def user_websocket(websocket: WebSocket):
@@ -819,16 +1356,17 @@ async def user_websocket(websocket: WebSocket):
                 lng = data.get("lng")
                 
                 if user_id in session_manager.active_sessions:
-                    session_manager.active_sessions[user_id].update_location(lat, lng)
+                    session = session_manager.active_sessions[user_id]
+                    session.update_location(lat, lng)
                     
                     # Send back traffic info for this location
-                    await websocket.send_json({
+                    session.enqueue(encode_message({
                         "type": "traffic_update",
                         "location": {"lat": lat, "lng": lng},
                         "signals": session_manager.traffic_signals,
-                        "timestamp": datetime.utcnow().isoformat(),
+                        "timestamp": datetime.utcnow(),
                         "success": True
-                    })
+                    }))
             
             elif data.get("type") == "vehicle_count":
                 # Update vehicle counts from user's camera
@@ -837,20 +1375,19 @@ async def user_websocket(websocket: WebSocket):
                 lane_3 = data.get("lane_3", 0)
                 
                 if user_id in session_manager.active_sessions:
-                    session_manager.active_sessions[user_id].update_vehicles(lane_1, lane_2, lane_3)
+                    now = datetime.utcnow()
+                    session_manager.update_vehicles(user_id, lane_1, lane_2, lane_3, now)
                     
                     # Recalculate signal timings
-                    signals = session_manager.calculate_optimal_signal_timing()
+                    session_manager.calculate_optimal_signal_timing(now)
                     
-                    # Broadcast signal update to all users
-                    await broadcast_to_all({
-                        "type": "signal_update",
-                        "signals": signals,
-                        "active_users": session_manager.get_active_users(),
-                        "active_cameras": session_manager.get_active_cameras(),
-                        "timestamp": datetime.utcnow().isoformat(),
-                        "success": True
-                    })
+                    # Broadcast what changed to all users
+                    await session_manager.broadcast_signals(
+                        now,
+                        active_users=session_manager.get_active_users(),
+                        active_cameras=session_manager.get_active_cameras(),
+                        success=True
+                    )
     
     except WebSocketDisconnect:
         session_manager.disconnect(user_id)
@@ -858,10 +1395,55 @@ async def user_websocket(websocket: WebSocket):
     except Exception as e:
         print(f"WebSocket error for user {user_id}: {e}")
 
+@app.websocket("/ws/frames")
+async def frame_websocket(websocket: WebSocket, user_id: str = None, camera_id: str = None):
+    """
+    Binary camera stream for trusted clients: each message is a raw frame
+    (see RAW_FRAME_HEADER), answered with the same payload as /process_frame_form.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_bytes()
+            
+            if not model:
+                await websocket.send_json({"error": "YOLO model not loaded", "success": False})
+                continue
+            
+            img_np = decode_raw_frame(data)
+            if img_np is None:
+                await websocket.send_json({"error": "Invalid raw frame", "success": False})
+                continue
+            
+            await websocket.send_text(encode_message(await analyze_camera_frame(img_np, user_id, camera_id)))
+    
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Frame WebSocket error for user {user_id}: {e}")
+
 # ==================== PROCESS FRAME (ENHANCED) ====================
 VEHICLE_CLASSES = {"car", "truck", "bus", "motorcycle", "bicycle", "bike", "autorickshaw", "van", "taxi"}
 EMERGENCY_CLASSES = {"ambulance"}
 
+# Lookup tables from YOLO class id, so lane bucketing runs as array ops
+VEHICLE_LABELS = tuple(sorted(VEHICLE_CLASSES))
+IS_VEHICLE = np.isin(CLASS_NAMES_LC, list(VEHICLE_CLASSES))
+IS_AMBULANCE = np.isin(CLASS_NAMES_LC, list(EMERGENCY_CLASSES))
+VEHICLE_INDEX = np.full(NUM_CLASSES, -1, dtype=np.intp)  # class id -> VEHICLE_LABELS index
+for _cls in np.flatnonzero(IS_VEHICLE):
+    VEHICLE_INDEX[_cls] = VEHICLE_LABELS.index(CLASS_NAMES_LC[_cls])
+
+def _decode_frame(img_str: str) -> np.ndarray:
+    """Decode a base64 JPEG; raises ValueError for undecodable input."""
+    try:
+        img_np = decode_image(base64.b64decode(img_str))
+    except Exception as e:
+        raise ValueError(str(e)) from e
+    if img_np is None:
+        raise ValueError("Could not decode image")
+    return img_np
+
 @app.post("/process_frame")
 async def process_frame(frame: FrameData):
     """
@@ -874,65 +1456,65 @@ async def process_frame(frame: FrameData):
     img_str = frame.image
     user_id = frame.user_id
     
+    # Frame stride: within MIN_FRAME_INTERVAL of this user's last inference,
+    # answer with that result instead of running YOLO again
+    started = time.monotonic()
+    if user_id:
+        session = session_manager.active_sessions.get(user_id)
+        if (session and session.last_payload is not None
+                and started - session_manager.last_infer_ts.get(user_id, 0.0) < MIN_FRAME_INTERVAL):
+            return session.last_payload
+    
     if "," in img_str:
         img_str = img_str.split(",", 1)[1]
 
     try:
-        img_data = base64.b64decode(img_str)
-        np_arr = np.frombuffer(img_data, np.uint8)
-        img_np = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-    except Exception as e:
+        img_np = await asyncio.to_thread(_decode_frame, img_str)
+    except ValueError as e:
         return {"error": "Invalid base64 image", "details": str(e), "success": False}
 
-    # Run YOLO detection
-    results = model(img_np)
+    # Detect in a shared forward pass with frames from other users
+    results = [await detect_batched(img_np)]
+
+    now = datetime.utcnow()
 
     h, w, _ = img_np.shape
     L1 = w // 3
     L2 = 2 * (w // 3)
 
-    lane1_counts = {c: 0 for c in VEHICLE_CLASSES}
-    lane2_counts = {c: 0 for c in VEHICLE_CLASSES}
-    lane3_counts = {c: 0 for c in VEHICLE_CLASSES}
-    ambulance_detected = False
-
-    for box in results[0].boxes:
-        cls = int(box.cls[0])
-        label = model.names[cls].lower()
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
-        mid_x = (x1 + x2) // 2
-
-        if label in VEHICLE_CLASSES:
-            if mid_x < L1:
-                lane1_counts[label] += 1
-            elif mid_x < L2:
-                lane2_counts[label] += 1
-            else:
-                lane3_counts[label] += 1
-
-        if label in EMERGENCY_CLASSES:
-            ambulance_detected = True
+    # One device-to-host copy of the (N, 6) [x1, y1, x2, y2, conf, cls] tensor for the whole frame
+    detections = results[0].boxes.data.cpu().numpy()
+    xyxy = detections[:, :4].astype(np.int64)
+    cls = detections[:, -1].astype(np.intp)
+
+    # Bucket every detection by box centre: lane 0 left of L1, 1 left of L2, else 2
+    mid_x = (xyxy[:, 0] + xyxy[:, 2]) // 2
+    lane_idx = np.searchsorted(np.array([L1, L2]), mid_x, side="right")
+    vehicle_idx = VEHICLE_INDEX[cls]
+    is_vehicle = IS_VEHICLE[cls]
+    counts = np.zeros((3, len(VEHICLE_LABELS)), dtype=np.int32)
+    np.add.at(counts, (lane_idx[is_vehicle], vehicle_idx[is_vehicle]), 1)
+    ambulance_detected = bool(IS_AMBULANCE[cls].any())
+
+    # Only classes actually seen; consumers sum the values, so zero entries carry nothing
+    lane1_counts, lane2_counts, lane3_counts = (
+        {label: n for label, n in zip(VEHICLE_LABELS, lane_counts) if n} for lane_counts in counts.tolist()
+    )
 
     # Calculate totals
-    total_lane1 = sum(lane1_counts.values())
-    total_lane2 = sum(lane2_counts.values())
-    total_lane3 = sum(lane3_counts.values())
+    total_lane1, total_lane2, total_lane3 = counts.sum(axis=1).tolist()
 
     # Update road graph with current traffic
     road_graph.update_traffic(total_lane1, total_lane2, total_lane3)
 
-    # Save to database
-    db: Session = SessionLocal()
-    new_entry = TrafficData(
+    # Queue for the next batched database write
+    _traffic_buffer.append(TrafficData(
         lane_1=total_lane1,
         lane_2=total_lane2,
         lane_3=total_lane3,
         ambulance_detected=ambulance_detected,
-        timestamp=datetime.utcnow()
-    )
-    db.add(new_entry)
-    db.commit()
-    db.close()
+        timestamp=now
+    ))
 
     # Update user session if user_id provided - WITH ERROR HANDLING
     if user_id:
@@ -942,22 +1524,20 @@ async def process_frame(frame: FrameData):
             await session_manager.connect(None, user_id)
         
         # Now safely update the user's session
-        session_manager.active_sessions[user_id].update_vehicles(
-            total_lane1, total_lane2, total_lane3
+        session_manager.update_vehicles(
+            user_id, total_lane1, total_lane2, total_lane3, now
         )
         
         # Recalculate signals with new data
-        signals = session_manager.calculate_optimal_signal_timing()
-        
-        # Broadcast signal update
-        await broadcast_to_all({
-            "type": "signal_update",
-            "signals": signals,
-            "active_users": session_manager.get_active_users(),
-            "active_cameras": session_manager.get_active_cameras(),
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": True
-        })
+        session_manager.calculate_optimal_signal_timing(now)
+        
+        # Broadcast what changed
+        await session_manager.broadcast_signals(
+            now,
+            active_users=session_manager.get_active_users(),
+            active_cameras=session_manager.get_active_cameras(),
+            success=True
+        )
 
     # Prepare payload for broadcast
     payload = {
@@ -968,12 +1548,16 @@ async def process_frame(frame: FrameData):
         "total_vehicles": total_lane1 + total_lane2 + total_lane3,
         "congestion_level": get_congestion_level(total_lane1 + total_lane2 + total_lane3),
         "user_id": user_id,
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": now,
         "success": True
     }
 
+    if user_id:
+        session_manager.active_sessions[user_id].last_payload = payload
+        session_manager.last_infer_ts[user_id] = started
+
     # Broadcast via WebSocket
-    asyncio.create_task(broadcast_traffic(payload))
+    broadcast_traffic(payload)
 
     return payload
 
@@ -986,11 +1570,11 @@ async def get_active_users():
         "active_cameras": session_manager.get_active_cameras(),
         "users": [{
             "id": user_id,
-            "last_active": session.last_active.isoformat(),
+            "last_active": session.last_active,
             "camera_active": session.camera_active,
             "location": session.location
         } for user_id, session in session_manager.active_sessions.items()],
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "success": True
     }
 
@@ -1002,48 +1586,50 @@ async def get_traffic_signals():
         "signals": signals,
         "active_users": session_manager.get_active_users(),
         "active_cameras": session_manager.get_active_cameras(),
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "success": True
     }
 
+_collective_cache: Optional[Tuple[int, float, dict]] = None  # (session version, monotonic time, result)
+
 @app.get("/collective_traffic")
 async def get_collective_traffic():
     """Get aggregated traffic data from all users"""
+    global _collective_cache
+    # Reuse the last result while no session changed and it is under COLLECTIVE_CACHE_TTL old
+    now_mono = time.monotonic()
+    if _collective_cache:
+        version, computed_at, cached = _collective_cache
+        if version == session_manager._version and now_mono - computed_at < COLLECTIVE_CACHE_TTL:
+            return cached
+    
+    # Per-lane totals and contributors are kept up to date by the session manager
     aggregated = {
-        "lane_1": {"total": 0, "users": 0, "average": 0},
-        "lane_2": {"total": 0, "users": 0, "average": 0},
-        "lane_3": {"total": 0, "users": 0, "average": 0}
+        lane: {
+            "total": total,
+            "users": session_manager.lane_contributors[lane],
+            "average": total / (session_manager.lane_contributors[lane] or 1)
+        }
+        for lane, total in session_manager.lane_totals.items()
     }
-    
-    active_cameras = 0
-    for session in session_manager.active_sessions.values():
-        if session.camera_active:
-            active_cameras += 1
-            for lane in aggregated:
-                count = session.detected_vehicles.get(lane, 0)
-                aggregated[lane]["total"] += count
-                if count > 0:
-                    aggregated[lane]["users"] += 1
-    
-    # Calculate averages
-    for lane in aggregated:
-        users = aggregated[lane]["users"] or 1
-        aggregated[lane]["average"] = aggregated[lane]["total"] / users
+    active_cameras = session_manager.get_active_cameras()
     
     # Calculate congestion level
     total_avg = sum(agg["average"] for agg in aggregated.values())
     
     congestion = get_congestion_level(int(total_avg))
     
-    return {
+    result = {
         "aggregated_data": aggregated,
         "congestion_level": congestion,
         "total_users": session_manager.get_active_users(),
         "active_cameras": active_cameras,
         "confidence_score": min(1.0, active_cameras / 10.0),
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "success": True
     }
+    _collective_cache = (session_manager._version, now_mono, result)
+    return result
 
 # ==================== FIXED ROUTE ENDPOINTS ====================
 @app.post("/optimize_route_multi_user")
@@ -1082,11 +1668,7 @@ async def optimize_route_multi_user(request: dict = Body(...)):
             route_path = [(start_lat, start_lng), (end_lat, end_lng)]
         
         # Calculate metrics
-        total_distance = 0
-        for i in range(len(route_path) - 1):
-            lat1, lng1 = route_path[i]
-            lat2, lng2 = route_path[i + 1]
-            total_distance += calculate_distance(lat1, lng1, lat2, lng2)
+        total_distance = calculate_path_distance(route_path)
         
         # Adjust speed based on collective congestion
         avg_speed = get_average_speed({
@@ -1113,15 +1695,11 @@ async def optimize_route_multi_user(request: dict = Body(...)):
         )
         
         if alt_path1 and alt_path1 != route_path:
-            alt_distance = 0
-            for i in range(len(alt_path1) - 1):
-                lat1, lng1 = alt_path1[i]
-                lat2, lng2 = alt_path1[i + 1]
-                alt_distance += calculate_distance(lat1, lng1, lat2, lng2)
+            alt_distance = calculate_path_distance(alt_path1)
             
             alternative_routes.append({
                 "name": "Alternative Route",
-                "path": [{"lat": lat, "lng": lng} for lat, lng in alt_path1],
+                "path": path_points(alt_path1),
                 "distance_km": round(alt_distance / 1000, 2),
                 "estimated_time_min": round((alt_distance / 1000) / avg_speed * 60, 1) if avg_speed > 0 else 0,
                 "reason": "Avoids busiest traffic lane"
@@ -1129,7 +1707,7 @@ async def optimize_route_multi_user(request: dict = Body(...)):
         
         return {
             "optimal_route": {
-                "path": [{"lat": lat, "lng": lng} for lat, lng in route_path],
+                "path": path_points(route_path),
                 "distance_km": round(total_distance / 1000, 2),
                 "estimated_time_min": round(estimated_time, 1),
                 "congestion_level": collective_data["congestion_level"],
@@ -1140,7 +1718,7 @@ async def optimize_route_multi_user(request: dict = Body(...)):
             "traffic_source": "multi_user_collective",
             "active_users_contributing": collective_data["active_cameras"],
             "confidence_score": collective_data["confidence_score"],
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": datetime.utcnow(),
             "success": True
         }
         
@@ -1158,9 +1736,8 @@ async def start_end_route(request: RouteRequest):
     """
     try:
         # Get latest traffic data from database
-        db: Session = SessionLocal()
-        latest = db.query(TrafficData).order_by(TrafficData.id.desc()).first()
-        db.close()
+        rows = await recent_traffic_rows(1)
+        latest = rows[0] if rows else None
 
         if not latest:
             # Return direct path if no traffic data
@@ -1172,16 +1749,16 @@ async def start_end_route(request: RouteRequest):
                 "message": "no traffic data yet",
                 "recommended_lane": "direct_route",
                 "traffic": {"lane_1": 0, "lane_2": 0, "lane_3": 0},
-                "path": [
-                    {"lat": request.start_lat, "lng": request.start_lng},
-                    {"lat": request.end_lat, "lng": request.end_lng}
-                ],
+                "path": path_points([
+                    (request.start_lat, request.start_lng),
+                    (request.end_lat, request.end_lng)
+                ]),
                 "route_type": "direct",
                 "distance_km": round(direct_distance / 1000, 2),
                 "estimated_time_min": round(direct_distance / 1000 / 30 * 60, 1),
                 "total_vehicles": 0,
                 "ambulance_detected": False,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.utcnow(),
                 "success": True
             }
 
@@ -1245,11 +1822,7 @@ async def start_end_route(request: RouteRequest):
         recommended_lane = min(lanes, key=lanes.get)
         
         # Calculate route metrics
-        total_distance = 0
-        for i in range(len(route_path) - 1):
-            lat1, lng1 = route_path[i]
-            lat2, lng2 = route_path[i + 1]
-            total_distance += calculate_distance(lat1, lng1, lat2, lng2)
+        total_distance = calculate_path_distance(route_path)
         
         avg_speed = get_average_speed(lanes)
         
@@ -1264,14 +1837,14 @@ async def start_end_route(request: RouteRequest):
             "recommended_lane": recommended_lane,
             "traffic": lanes,
             "traffic_source": traffic_source,
-            "path": [{"lat": lat, "lng": lng} for lat, lng in route_path],
+            "path": path_points(route_path),
             "route_type": route_type,
             "lanes_used": list(lanes_in_route),
             "distance_km": round(total_distance / 1000, 2),
             "estimated_time_min": round(total_distance / 1000 / avg_speed * 60, 1) if avg_speed > 0 else 0,
             "total_vehicles": sum(lanes.values()),
             "ambulance_detected": latest.ambulance_detected,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": datetime.utcnow(),
             "avg_speed_kmh": avg_speed,
             "priority": request.priority,
             "avoided_lanes": avoid_lanes,
@@ -1306,6 +1879,8 @@ async def start_end_route(request: RouteRequest):
 # ==================== EXISTING ENDPOINTS (KEPT FOR COMPATIBILITY) ====================
 @app.post("/update_traffic")
 async def update_traffic(data: TrafficRequest):
+    now = datetime.utcnow()
+    
     # Update road graph with current traffic
     road_graph.update_traffic(data.lane_1, data.lane_2, data.lane_3)
     
@@ -1315,67 +1890,55 @@ async def update_traffic(data: TrafficRequest):
         if data.user_id not in session_manager.active_sessions:
             await session_manager.connect(None, data.user_id)
         
-        session_manager.active_sessions[data.user_id].update_vehicles(
-            data.lane_1, data.lane_2, data.lane_3
+        session_manager.update_vehicles(
+            data.user_id, data.lane_1, data.lane_2, data.lane_3, now
         )
         
         # Recalculate signals
-        signals = session_manager.calculate_optimal_signal_timing()
+        session_manager.calculate_optimal_signal_timing(now)
         
-        # Broadcast signal update
-        await broadcast_to_all({
-            "type": "signal_update",
-            "signals": signals,
-            "timestamp": datetime.utcnow().isoformat(),
-            "success": True
-        })
+        # Broadcast what changed
+        await session_manager.broadcast_signals(now, success=True)
     
-    # Save to database
-    db: Session = SessionLocal()
-    entry = TrafficData(
+    # Queue for the next batched database write
+    _traffic_buffer.append(TrafficData(
         lane_1=data.lane_1,
         lane_2=data.lane_2,
         lane_3=data.lane_3,
         ambulance_detected=data.ambulance_detected,
-        timestamp=datetime.utcnow()
-    )
-    db.add(entry)
-    db.commit()
-    db.close()
+        timestamp=now
+    ))
 
     payload = {
         "lane_1": {"total": data.lane_1},
         "lane_2": {"total": data.lane_2},
         "lane_3": {"total": data.lane_3},
         "ambulance_detected": data.ambulance_detected,
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": now,
         "success": True
     }
-    asyncio.create_task(broadcast_traffic(payload))
+    broadcast_traffic(payload)
 
     return {"message": "ok", "user_updated": data.user_id is not None, "success": True}
 
 @app.get("/latest_traffic")
-def latest_traffic():
-    db: Session = SessionLocal()
-    result = db.query(TrafficData).order_by(TrafficData.id.desc()).first()
-    db.close()
-    if not result:
+async def latest_traffic():
+    rows = await recent_traffic_rows(1)
+    if not rows:
         return {"message": "no data", "success": False}
+    result = rows[0]
     return {
         "lane_1": result.lane_1,
         "lane_2": result.lane_2,
         "lane_3": result.lane_3,
         "ambulance_detected": result.ambulance_detected,
-        "timestamp": result.timestamp.isoformat() if getattr(result, "timestamp", None) else None,
+        "timestamp": getattr(result, "timestamp", None),
         "success": True
     }
 
 @app.get("/recommend_route")
-def recommend_route(limit: int = 5):
-    db: Session = SessionLocal()
-    rows = db.query(TrafficData).order_by(TrafficData.id.desc()).limit(limit).all()
-    db.close()
+async def recommend_route(limit: int = 5):
+    rows = await recent_traffic_rows(limit)
     if not rows:
         return {"message": "no data", "recommended_lane": None, "success": False}
 
@@ -1392,6 +1955,24 @@ def recommend_route(limit: int = 5):
         "success": True
     }
 
+# Average total vehicles per 5-minute bucket: the forecast steps are 5 minutes,
+# so Prophet fits on one point per bucket instead of one per frame.
+# Only the newest PREDICT_MAX_POINTS buckets (one week) are fitted.
+PREDICT_MAX_POINTS = 2016
+PREDICT_BUCKET_SQL = f"""
+    SELECT ds, y FROM (
+        SELECT strftime('%Y-%m-%d %H:%M:00', timestamp, '-' || (strftime('%M', timestamp) % 5) || ' minutes') AS ds,
+               AVG(lane_1 + lane_2 + lane_3) AS y
+        FROM traffic_data
+        GROUP BY ds
+        ORDER BY ds DESC
+        LIMIT {PREDICT_MAX_POINTS}
+    )
+    ORDER BY ds ASC
+"""
+# Last forecast, keyed by (bucket count, newest bucket)
+_prophet_cache: Dict[str, Any] = {"key": None, "prediction": None}
+
 @app.get("/predict_traffic")
 def predict_traffic():
     if not PROPHET_AVAILABLE:
@@ -1399,7 +1980,7 @@ def predict_traffic():
 
     db: Session = SessionLocal()
     try:
-        df = pd.read_sql("SELECT timestamp as ds, (lane_1 + lane_2 + lane_3) as y FROM traffic_data ORDER BY timestamp ASC", db.bind)
+        df = pd.read_sql(PREDICT_BUCKET_SQL, db.bind)
     except:
         db.close()
         return {"error": "not enough data", "success": False}
@@ -1408,12 +1989,18 @@ def predict_traffic():
     if df.empty or len(df) < 5:
         return {"error": "not enough data", "success": False}
     
+    # Refit only once a new bucket has started
+    key = (len(df), df["ds"].iloc[-1])
+    if _prophet_cache["key"] == key:
+        return {"prediction": _prophet_cache["prediction"], "success": True}
+    
     try:
         model_prophet = Prophet()
         model_prophet.fit(df)
         future = model_prophet.make_future_dataframe(periods=3, freq='5min')
         forecast = model_prophet.predict(future)
         next_15 = forecast[['ds', 'yhat']].tail(3).to_dict(orient='records')
+        _prophet_cache.update(key=key, prediction=next_15)
         return {"prediction": next_15, "success": True}
     except Exception as e:
         return {"error": str(e), "success": False}
@@ -1421,32 +2008,17 @@ def predict_traffic():
 @app.get("/road_network")
 def get_road_network():
     """Returns information about the road network for visualization."""
-    roads = []
-    
-    # Group nodes by lane type to form road segments
-    lane_nodes = {}
-    for node_id, node in road_graph.nodes.items():
-        if node.lane_type:
-            if node.lane_type not in lane_nodes:
-                lane_nodes[node.lane_type] = []
-            lane_nodes[node.lane_type].append({
-                "id": node_id,
-                "lat": node.lat,
-                "lng": node.lng,
-                "traffic_cost": node.traffic_cost
-            })
-    
-    # Create road segments
-    for lane_type, nodes in lane_nodes.items():
-        # Sort nodes by latitude and longitude for proper ordering
-        nodes.sort(key=lambda x: (x['lat'], x['lng']))
-        
-        road = {
-            "lane_type": lane_type,
-            "nodes": nodes,
-            "traffic_level": road_graph.lane_traffic[lane_type] if lane_type in road_graph.lane_traffic else 1.0
-        }
-        roads.append(road)
+    # Road segments come from the graph's pre-sorted lane groups; only costs are read per call
+    roads = [{
+        "lane_type": lane_type,
+        "nodes": [{
+            "id": node.node_id,
+            "lat": node.lat,
+            "lng": node.lng,
+            "traffic_cost": node.traffic_cost
+        } for node in nodes],
+        "traffic_level": road_graph.lane_traffic.get(lane_type, 1.0)
+    } for lane_type, nodes in road_graph.lane_groups.items() if nodes]
     
     return {
         "roads": roads,
@@ -1465,18 +2037,28 @@ async def periodic_signal_optimization():
     while True:
         await asyncio.sleep(60)  # Every minute
         
-        if session_manager.get_active_cameras() > 0:
-            signals = session_manager.calculate_optimal_signal_timing()
+        active_cameras = session_manager.get_active_cameras()
+        if active_cameras > 0:
+            now = datetime.utcnow()
+            signals = session_manager.calculate_optimal_signal_timing(now)
             
             await broadcast_to_all({
                 "type": "signal_optimization",
                 "signals": signals,
                 "message": "Traffic signals optimized based on collective data",
                 "active_users": session_manager.get_active_users(),
-                "active_cameras": session_manager.get_active_cameras(),
-                "timestamp": datetime.utcnow().isoformat(),
+                "active_cameras": active_cameras,
+                "timestamp": now,
                 "success": True
             })
+            # Clients now hold the full set; later deltas are relative to it
+            session_manager.remember_signals()
+
+async def periodic_traffic_flush():
+    """Flush buffered traffic rows to the database in batches"""
+    while True:
+        await asyncio.sleep(TRAFFIC_FLUSH_INTERVAL)
+        await flush_traffic_buffer()
 
 async def cleanup_inactive_sessions():
     """Clean up sessions that have been inactive for too long"""
@@ -1502,10 +2084,20 @@ async def cleanup_inactive_sessions():
 async def startup_event():
     """Start background tasks on startup"""
     asyncio.create_task(periodic_signal_optimization())
+    asyncio.create_task(session_manager._signal_worker())
     asyncio.create_task(cleanup_inactive_sessions())
+    asyncio.create_task(periodic_traffic_flush())
+    asyncio.create_task(yolo_batch_worker())
+    # Warm up on the inference pool without holding up startup
+    asyncio.get_running_loop().run_in_executor(inference_pool, warmup_model)
     print("Smart Traffic Management System started with multi-user support!")
     print(f"API Documentation available at: http://localhost:8000/docs")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist any traffic rows still waiting in the write buffer"""
+    await flush_traffic_buffer()
+
 # ==================== HEALTH CHECK ====================
 @app.get("/")
 def read_root():
@@ -1537,7 +2129,8 @@ def read_root():
             "/traffic_heatmap (GET) - Heatmap data",
             "/system_status (GET) - System health",
             "/ws/user (WebSocket) - User updates",
-            "/ws/traffic (WebSocket) - General traffic updates"
+            "/ws/traffic (WebSocket) - General traffic updates",
+            "/ws/frames (WebSocket) - Raw camera frame stream"
         ],
         "stats": {
             "active_users": session_manager.get_active_users(),
@@ -1545,7 +2138,7 @@ def read_root():
             "road_nodes": len(road_graph.nodes),
             "yolo_model_loaded": model is not None
         },
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "success": True
     }
 
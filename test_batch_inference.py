@@ -0,0 +1,27 @@
+# test_batch_inference.py - exported YOLO models must accept batched frames
+"""
+yolo_batch_worker sends 1..INFER_BATCH_MAX frames per forward pass, so an
+exported model has to run every batch size up to that, not only 1.
+
+Needs ultralytics and openvino (skipped otherwise); exports yolov8n once.
+"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("ultralytics")
+pytest.importorskip("openvino")
+
+os.environ["STMS_MODEL_FORMAT"] = "openvino"
+os.environ.pop("STMS_INT8", None)
+
+import main
+
+@pytest.mark.parametrize("batch", [1, 2, main.INFER_BATCH_MAX])
+def test_openvino_model_runs_batches(batch):
+    assert main.model is not None
+    assert os.path.isdir(os.path.splitext(main.YOLO_WEIGHTS)[0] + "_openvino_model")
+    frames = [np.zeros((480, 640, 3), dtype=np.uint8) for _ in range(batch)]
+    results = main.run_model(frames)
+    assert len(results) == batch
@@ -1,18 +1,9 @@
-import sqlite3
+# traffic_history.py - create the forecasting history table (see traffic_model.TrafficHistory)
+from traffic_model import engine, TrafficHistory
 
-conn = sqlite3.connect("traffic.db")
-cursor = conn.cursor()
+# Lives in the main database now, so traffic_prediction shares its engine and pool
+TrafficHistory.__table__.create(bind=engine, checkfirst=True)
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS traffic_history (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    location_lat FLOAT,
-    location_lng FLOAT,
-    vehicle_count INTEGER,
-    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-)
-""")
-
-conn.commit()
-conn.close()
+# Per-user history lookups, time-range scans (cleanup) and per-location forecasting
+for index in TrafficHistory.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
@@ -1,23 +1,85 @@
 # traffic_model.py - SIMPLE DATABASE MODEL
-from sqlalchemy import create_engine, Column, Integer, Boolean, DateTime, String, Float, Text
+from sqlalchemy import create_engine, event, make_url, Column, Index, Integer, Boolean, DateTime, String, Float, Text
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 from datetime import datetime
 import os
 
 # Database URL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./traffic_data.db")
 
-# Create SQLAlchemy engine
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
-    echo=False
-)
+# Create SQLAlchemy engine with an explicit, reused connection pool.
+# In-memory SQLite must share one connection (StaticPool); a file database keeps
+# a QueuePool of already-open connections since sessions run on several threads.
+if DATABASE_URL.startswith("sqlite") and ":memory:" in DATABASE_URL:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+        echo=False
+    )
+elif DATABASE_URL.startswith("sqlite"):
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=10,
+        max_overflow=10,
+        pool_timeout=30,
+        echo=False
+    )
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        poolclass=QueuePool,
+        pool_size=20,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_pre_ping=True,
+        echo=False
+    )
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL so readers never block the batched writes; NORMAL syncs at checkpoints, not every commit."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")  # 64 MB page cache
+    cursor.close()
+
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for queries made from request handlers; needs an async driver.
+# SQLite URLs are switched to aiosqlite; other databases need an explicit
+# ASYNC_DATABASE_URL. Without one, AsyncSessionLocal is None and callers
+# fall back to the sync engine.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+if ASYNC_DATABASE_URL is None and make_url(DATABASE_URL).get_backend_name() == "sqlite":
+    ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(drivername="sqlite+aiosqlite")
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE_URL is not None:
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+        if make_url(ASYNC_DATABASE_URL).get_backend_name() == "sqlite":
+            event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    except ImportError:
+        async_engine = None
+    except InvalidRequestError as e:
+        # e.g. an ASYNC_DATABASE_URL naming a sync driver
+        print(f"Warning: async database engine unavailable ({e}); using the sync engine")
+        async_engine = None
+
 # Create Base class
 Base = declarative_base()
 
@@ -26,41 +88,68 @@ class TrafficData(Base):
     Simple traffic data model
     """
     __tablename__ = "traffic_data"
+    # Per-location / per-user time-range queries become index range scans
+    __table_args__ = (
+        Index("ix_loc_ts", "location", "timestamp"),
+        Index("ix_user_ts", "user_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     lane_1 = Column(Integer, default=0)
     lane_2 = Column(Integer, default=0)
     lane_3 = Column(Integer, default=0)
     ambulance_detected = Column(Boolean, default=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     location = Column(String(255), nullable=True)
     user_id = Column(String(100), nullable=True)
 
+class TrafficHistory(Base):
+    """
+    Per-location vehicle counts used for forecasting (traffic_prediction.py)
+    """
+    __tablename__ = "traffic_history"
+    __table_args__ = (
+        Index("idx_th_user_ts", "user_id", "timestamp"),
+        Index("ix_geo_key", "geo_key", "timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer)
+    location_lat = Column(Float)
+    location_lng = Column(Float)
+    vehicle_count = Column(Integer)
+    # UTC ISO-8601 text ("2024-01-01T08:05:00"): sorts lexicographically, no datetime adapters
+    timestamp = Column(Text, default=lambda: datetime.utcnow().isoformat(timespec="seconds"), index=True)
+    geo_key = Column(String(32))  # "lat:lng" rounded to 4 decimals
+
 def init_db():
     """
-    Initialize database - DROP AND RECREATE for simplicity
+    Initialize database - create missing tables, keep existing data
     """
     try:
-        # Drop all tables and recreate
-        Base.metadata.drop_all(bind=engine)
-        Base.metadata.create_all(bind=engine)
+        Base.metadata.create_all(bind=engine, checkfirst=True)
+        # create_all skips tables that already exist, so add newer indexes to them too
+        for table in (TrafficData.__table__, TrafficHistory.__table__):
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
         print("✅ Database tables created successfully")
         
-        # Add a test record
-        db = SessionLocal()
-        test_data = TrafficData(
-            lane_1=5,
-            lane_2=3,
-            lane_3=2,
-            ambulance_detected=False,
-            location="Test Intersection",
-            user_id="system"
-        )
-        db.add(test_data)
-        db.commit()
-        db.close()
-        
-        print("✅ Test data added")
+        # Add a test record (TRAFFIC_SEED=1)
+        if os.getenv("TRAFFIC_SEED") == "1":
+            db = SessionLocal()
+            test_data = TrafficData(
+                lane_1=5,
+                lane_2=3,
+                lane_3=2,
+                ambulance_detected=False,
+                location="Test Intersection",
+                user_id="system"
+            )
+            db.add(test_data)
+            db.commit()
+            db.close()
+            
+            print("✅ Test data added")
         
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
@@ -76,8 +165,18 @@ def get_db():
     finally:
         db.close()
 
-# Initialize on import
-try:
-    init_db()
-except Exception as e:
-    print(f"Warning: {e}")
\ No newline at end of file
+# Initialize on import only when asked (TRAFFIC_INIT_DB=1); otherwise run
+# `python -m traffic_model init` once, or let the API create the tables at startup
+if os.getenv("TRAFFIC_INIT_DB") == "1":
+    try:
+        init_db()
+    except Exception as e:
+        print(f"Warning: {e}")
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["init"]:
+        init_db()
+    else:
+        print("Usage: python -m traffic_model init")
+        sys.exit(2)
\ No newline at end of file
@@ -1,48 +1,415 @@
 # traffic_prediction.py
 from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, List
 from datetime import datetime
+from functools import lru_cache
+import numpy as np
 import pandas as pd
-from prophet import Prophet
-import sqlite3
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import bindparam, insert, text
+from sqlalchemy.exc import SQLAlchemyError
 
-router = APIRouter()
+import ets
+from traffic_model import engine, async_engine, TrafficHistory
+
+# Forecasting backends are optional; statsforecast's Numba-compiled ETS fits a
+# short 5-minute series in milliseconds, Prophet (Stan) takes seconds.
+try:
+    from prophet import Prophet
+    PROPHET_AVAILABLE = True
+except Exception:
+    PROPHET_AVAILABLE = False
+
+# Persist JIT-compiled kernels between worker starts; must be set before numba is imported.
+# Build images can bake this directory after one warm run.
+os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".numba_cache"))
+os.environ.setdefault("NIXTLA_NUMBA_CACHE", "1")
+
+try:
+    from statsforecast import StatsForecast
+    from statsforecast.models import AutoETS
+    STATSFORECAST_AVAILABLE = True
+except Exception:
+    STATSFORECAST_AVAILABLE = False
+
+# TRAFFIC_FORECASTER=prophet keeps the original model; =ets uses the plain-NumPy
+# smoother in ets.py (no JIT or Stan at all), also the fallback when neither is installed
+FORECASTER = os.getenv(
+    "TRAFFIC_FORECASTER",
+    "statsforecast" if STATSFORECAST_AVAILABLE else "prophet" if PROPHET_AVAILABLE else "ets"
+).strip().lower()
+_FORECASTERS = {"statsforecast": STATSFORECAST_AVAILABLE, "prophet": PROPHET_AVAILABLE, "ets": True}
+if not _FORECASTERS.get(FORECASTER):
+    print(f"Forecaster '{FORECASTER}' unknown or not installed, using ets")
+    FORECASTER = "ets"
+FORECAST_HORIZON = 3
+SEASON_LENGTH = 12  # one hour of 5-minute buckets
+MIN_POINTS = 5
+AUTOETS_MIN_POINTS = 7  # AutoETS rejects shorter series ("tiny datasets")
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+# History lives in traffic_model's database (TrafficHistory) and goes through
+# its pooled engine; reads and writes share that pool's connections and pragmas.
+
+# Fitted models per location: key -> (model, newest timestamp fitted, fit time).
+# Dropped when /update_traffic writes to the location or after MODEL_TTL seconds.
+MODEL_TTL = 300
+MODEL_CACHE_SIZE = 1024
+FORECAST_TTL = 30
+_MODEL_CACHE = {}
+_FORECAST_CACHE = {}  # key -> (forecast records, time)
+# key -> number of invalidations; a fit is only cached if this did not change
+# between reading the history and storing the result
+_GENERATION = {}
+_cache_lock = threading.Lock()
+
+def geo_key(lat: float, lng: float) -> str:
+    """Rounded location key stored with each row; ~11 m cells avoid exact float matching."""
+    return f"{round(lat, 4)}:{round(lng, 4)}"
+
+def _invalidate(key):
+    with _cache_lock:
+        _MODEL_CACHE.pop(key, None)
+        _FORECAST_CACHE.pop(key, None)
+        _GENERATION[key] = _GENERATION.get(key, 0) + 1
+
+class TrafficDataIn(BaseModel):
+    # Validated entirely in pydantic-core: unknown fields rejected, bounds checked
+    model_config = ConfigDict(extra="forbid", frozen=True)
 
-class TrafficData(BaseModel):
     user_id: int
-    location_lat: float
-    location_lng: float
-    vehicle_count: int
+    location_lat: Annotated[float, Field(ge=-90, le=90)]
+    location_lng: Annotated[float, Field(ge=-180, le=180)]
+    vehicle_count: Annotated[int, Field(ge=0)]
+
+# ==================== Batched Writer ====================
+# /update_traffic only enqueues on the event loop; one background task commits
+# whatever piled up every INSERT_FLUSH_INTERVAL seconds through the async
+# (aiosqlite) engine, so N requests cost one transaction/sync and no threads.
+INSERT_SQL = insert(TrafficHistory)
+INSERT_BATCH_MAX = 500
+INSERT_FLUSH_INTERVAL = 0.2
+_INSERT_Q: asyncio.Queue = None  # created on startup, on the serving loop
+_writer_task = None
+_STOP = object()  # queued on shutdown: write what came before it, then exit
+
+async def _drain(q: asyncio.Queue, max_items: int, timeout: float):
+    """Wait up to `timeout` for the first row, then take whatever else is already queued."""
+    try:
+        rows = [await asyncio.wait_for(q.get(), timeout)]
+    except asyncio.TimeoutError:
+        return []
+    while len(rows) < max_items and not q.empty():
+        rows.append(q.get_nowait())
+    return rows
+
+def _write_rows_sync(rows):
+    with engine.begin() as conn:
+        conn.execute(INSERT_SQL, rows)
+
+async def _write_rows(rows):
+    try:
+        if async_engine is None:
+            await asyncio.to_thread(_write_rows_sync, rows)
+        else:
+            async with async_engine.begin() as conn:
+                await conn.execute(INSERT_SQL, rows)
+    except SQLAlchemyError as e:
+        print(f"Error flushing traffic history ({len(rows)} rows): {e}")
+        return
+    # Forecasts for the touched locations are stale only once the rows are visible
+    for key in {row["geo_key"] for row in rows}:
+        _invalidate(key)
+
+async def _writer_loop(q: asyncio.Queue):
+    while True:
+        rows = await _drain(q, INSERT_BATCH_MAX, INSERT_FLUSH_INTERVAL)
+        stop = any(row is _STOP for row in rows)
+        rows = [row for row in rows if row is not _STOP]
+        if rows:
+            await _write_rows(rows)
+        if stop:
+            return
+
+@router.on_event("startup")
+async def _start_writer():
+    global _INSERT_Q, _writer_task
+    if _writer_task is not None:
+        return  # startup handlers of an included router can fire twice
+    _INSERT_Q = asyncio.Queue()
+    _writer_task = asyncio.create_task(_writer_loop(_INSERT_Q))
+
+@router.on_event("shutdown")
+async def _stop_writer():
+    global _INSERT_Q, _writer_task
+    if _writer_task is None:
+        return
+    # Let the loop finish the batch it holds and everything queued before the marker
+    _INSERT_Q.put_nowait(_STOP)
+    await _writer_task
+    _INSERT_Q = _writer_task = None
+    if async_engine is not None:
+        await async_engine.dispose()  # its connections belong to this event loop
 
 @router.post("/update_traffic")
-def update_traffic(data: TrafficData):
-    conn = sqlite3.connect("traffic.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO traffic_history (user_id, location_lat, location_lng, vehicle_count, timestamp)
-        VALUES (?, ?, ?, ?, ?)
-    """, (data.user_id, data.location_lat, data.location_lng, data.vehicle_count, datetime.now()))
-    conn.commit()
-    conn.close()
-    return {"status": "ok"}
+async def update_traffic(data: TrafficDataIn):
+    _INSERT_Q.put_nowait({
+        **data.model_dump(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "geo_key": geo_key(data.location_lat, data.location_lng)
+    })
+    return {"status": "queued"}
 
-@router.get("/predict_traffic")
-def predict_traffic(lat: float, lng: float):
-    conn = sqlite3.connect("traffic.db")
-    df = pd.read_sql_query(f"""
-        SELECT timestamp as ds, vehicle_count as y
+# Fixed SQL text so the connection's statement cache reuses the prepared plan (ix_geo_key seek).
+# History is averaged into 5-minute buckets and capped to the latest week before fitting.
+PREDICT_MAX_POINTS = 2016
+PREDICT_SQL = text(f"""
+    SELECT ds, y FROM (
+        SELECT strftime('%Y-%m-%d %H:%M:00', timestamp, '-' || (strftime('%M', timestamp) % 5) || ' minutes') AS ds,
+               AVG(vehicle_count) AS y
         FROM traffic_history
-        WHERE location_lat={lat} AND location_lng={lng}
-        ORDER BY timestamp ASC
-    """, conn)
-    conn.close()
-
-    if len(df) < 5:
-        return {"prediction": "Not enough data"}
-
-    model = Prophet()
-    model.fit(df)
-    future = model.make_future_dataframe(periods=3, freq='5min')
-    forecast = model.predict(future)
-    next_15 = forecast[['ds', 'yhat']].tail(3).to_dict(orient='records')
+        WHERE geo_key = :geo_key
+        GROUP BY ds
+        ORDER BY ds DESC
+        LIMIT {PREDICT_MAX_POINTS}
+    )
+    ORDER BY ds ASC
+""")
+
+# Same buckets for many locations in one round-trip, newest PREDICT_MAX_POINTS per location
+PREDICT_BATCH_SQL = text(f"""
+    SELECT geo_key, ds, y FROM (
+        SELECT geo_key, ds, y,
+               ROW_NUMBER() OVER (PARTITION BY geo_key ORDER BY ds DESC) AS rn
+        FROM (
+            SELECT geo_key,
+                   strftime('%Y-%m-%d %H:%M:00', timestamp, '-' || (strftime('%M', timestamp) % 5) || ' minutes') AS ds,
+                   AVG(vehicle_count) AS y
+            FROM traffic_history
+            WHERE geo_key IN :geo_keys
+            GROUP BY geo_key, ds
+        )
+    )
+    WHERE rn <= {PREDICT_MAX_POINTS}
+    ORDER BY geo_key, ds ASC
+""").bindparams(bindparam("geo_keys", expanding=True))
+
+# Fits are CPU-bound, so they run in worker processes (up to 4 by default)
+# instead of blocking the server; the caches above stay in this process.
+FIT_WORKERS = int(os.getenv("TRAFFIC_FIT_WORKERS", str(min(4, os.cpu_count() or 1))))
+_fit_pool = None
+
+@router.get("/predict_traffic")
+async def predict_traffic(lat: float, lng: float):
+    key = geo_key(lat, lng)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _FORECAST_CACHE.get(key)
+        if cached and now - cached[1] < FORECAST_TTL:
+            return {"prediction": cached[0]}
+        cached = _MODEL_CACHE.get(key)
+        model, last_ds = cached[:2] if cached and now - cached[2] < MODEL_TTL else (None, None)
+        generation = _GENERATION.get(key, 0)
+
+    if model is not None:
+        next_15 = await asyncio.to_thread(_forecast, model, last_ds)
+    else:
+        rows = await asyncio.to_thread(_fetch_history, key)
+        if len(rows) < MIN_POINTS:
+            return {"prediction": "Not enough data"}
+        model, next_15 = await asyncio.wrap_future(_get_fit_pool().submit(_fit_and_forecast, rows))
+        with _cache_lock:
+            if _GENERATION.get(key, 0) == generation:
+                if len(_MODEL_CACHE) >= MODEL_CACHE_SIZE:
+                    _MODEL_CACHE.pop(next(iter(_MODEL_CACHE)))
+                _MODEL_CACHE[key] = (model, rows[-1][0], now)
+
+    _remember_forecast(key, next_15, now, generation)
     return {"prediction": next_15}
+
+class LocationIn(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    lat: Annotated[float, Field(ge=-90, le=90)]
+    lng: Annotated[float, Field(ge=-180, le=180)]
+
+class BatchPredictIn(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
+    locations: Annotated[List[LocationIn], Field(min_length=1, max_length=500)]
+
+@router.post("/predict_traffic_batch")
+async def predict_traffic_batch(request: BatchPredictIn):
+    """Forecast many locations with one history query and one panel fit."""
+    keys = [geo_key(loc.lat, loc.lng) for loc in request.locations]
+    now = time.monotonic()
+    predictions = {}
+    with _cache_lock:
+        generations = {key: _GENERATION.get(key, 0) for key in keys}
+        for key in keys:
+            cached = _FORECAST_CACHE.get(key)
+            if cached and now - cached[1] < FORECAST_TTL:
+                predictions[key] = cached[0]
+    missing = [key for key in dict.fromkeys(keys) if key not in predictions]
+
+    if missing:
+        rows = await asyncio.to_thread(_fetch_history_batch, missing)
+        series = {}
+        for key, ds, y in rows:
+            series.setdefault(key, []).append((ds, y))
+        series = {key: points for key, points in series.items() if len(points) >= MIN_POINTS}
+        if series:
+            pool = _get_fit_pool()
+            if FORECASTER == "statsforecast":
+                forecasts = await asyncio.wrap_future(pool.submit(_forecast_panel, series))
+            else:
+                # No panel mode here; fit the locations side by side in the pool
+                fitted = await asyncio.gather(*(
+                    asyncio.wrap_future(pool.submit(_fit_and_forecast, points)) for points in series.values()
+                ))
+                forecasts = {key: next_15 for key, (_, next_15) in zip(series, fitted)}
+            for key, next_15 in forecasts.items():
+                _remember_forecast(key, next_15, now, generations[key])
+            predictions.update(forecasts)
+
+    return {"predictions": [
+        {"lat": loc.lat, "lng": loc.lng, "prediction": predictions.get(key, "Not enough data")}
+        for loc, key in zip(request.locations, keys)
+    ]}
+
+def _remember_forecast(key, next_15, now: float, generation: int):
+    with _cache_lock:
+        if _GENERATION.get(key, 0) != generation:
+            return  # new rows arrived while fitting; don't cache a stale forecast
+        if len(_FORECAST_CACHE) >= MODEL_CACHE_SIZE:
+            _FORECAST_CACHE.pop(next(iter(_FORECAST_CACHE)))
+        _FORECAST_CACHE[key] = (next_15, now)
+
+def _fetch_history(key: str):
+    with engine.connect() as conn:
+        return conn.execute(PREDICT_SQL, {"geo_key": key}).all()
+
+def _fetch_history_batch(keys):
+    with engine.connect() as conn:
+        return conn.execute(PREDICT_BATCH_SQL, {"geo_keys": keys}).all()
+
+def _history_frame(rows) -> pd.DataFrame:
+    # Typed columns straight from the rows; no read_sql dtype inference or string dates
+    return pd.DataFrame({
+        "ds": np.fromiter((row[0] for row in rows), dtype="datetime64[s]", count=len(rows)),
+        "y": np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    }, copy=False)
+
+def _fit_and_forecast(rows):
+    """Runs in a pool worker: rows in, (fitted model, next 15 minutes) out."""
+    model = _fit(_history_frame(rows))
+    return model, _forecast(model, rows[-1][0])
+
+def _forecast_panel(series):
+    """Runs in a pool worker: {geo_key: rows} in, {geo_key: next 15 minutes} out, fitted as one panel."""
+    # Series too short for AutoETS would fail the whole panel; _fit smooths those one by one
+    forecasts = {
+        key: _fit_and_forecast(rows)[1]
+        for key, rows in series.items() if len(rows) < AUTOETS_MIN_POINTS
+    }
+    panel = [_history_frame(rows).assign(unique_id=key) for key, rows in series.items() if key not in forecasts]
+    if panel:
+        sf = StatsForecast(models=[AutoETS(season_length=SEASON_LENGTH)], freq='5min', n_jobs=1)
+        forecast = sf.forecast(df=pd.concat(panel, ignore_index=True), h=FORECAST_HORIZON)
+        forecast = forecast.rename(columns={"AutoETS": "yhat"})
+        forecasts.update((key, _records(group)) for key, group in forecast.groupby("unique_id", sort=False))
+    return forecasts
+
+if PROPHET_AVAILABLE:
+    class _SharedBackendProphet(Prophet):
+        """Prophet that loads the compiled Stan model once per process, not per instance."""
+        _backend = None
+
+        def _load_stan_backend(self, stan_backend):
+            cls = type(self)
+            if cls._backend is None:
+                super()._load_stan_backend(stan_backend)
+                cls._backend = self.stan_backend
+            self.stan_backend = cls._backend
+
+def _fit(df: pd.DataFrame):
+    if FORECASTER == "ets" or (FORECASTER == "statsforecast" and len(df) < AUTOETS_MIN_POINTS):
+        return ets.fit(df["y"].to_numpy())
+    if FORECASTER == "statsforecast":
+        sf = StatsForecast(models=[AutoETS(season_length=SEASON_LENGTH)], freq='5min', n_jobs=1)
+        return sf.fit(df.assign(unique_id=0))
+    # Only a daily cycle matters for 5-minute city traffic; MAP fit, no posterior sampling
+    model = _SharedBackendProphet(
+        daily_seasonality=True,
+        weekly_seasonality=False,
+        yearly_seasonality=False,
+        n_changepoints=5,
+        uncertainty_samples=0,
+        mcmc_samples=0
+    )
+    return model.fit(df)
+
+def _forecast(model, last_ds: str):
+    if isinstance(model, ets.EtsModel):
+        forecast = _future_df(last_ds, FORECAST_HORIZON, '5min').assign(yhat=ets.forecast(model, FORECAST_HORIZON))
+    elif FORECASTER == "statsforecast":
+        forecast = model.predict(h=FORECAST_HORIZON).rename(columns={"AutoETS": "yhat"})
+    else:
+        # Only the future rows; predicting the whole history again is wasted work
+        forecast = model.predict(_future_df(last_ds, FORECAST_HORIZON, '5min'))
+    return _records(forecast.tail(FORECAST_HORIZON))
+
+@lru_cache(maxsize=4096)
+def _future_df(last_ds: str, periods: int, freq: str) -> pd.DataFrame:
+    """The `periods` timestamps after last_ds. Shared between calls: do not mutate."""
+    idx = pd.date_range(start=last_ds, periods=periods + 1, freq=freq, inclusive='right')
+    return pd.DataFrame({"ds": idx})
+
+def _records(forecast: pd.DataFrame):
+    return [
+        {"ds": ds, "yhat": yhat}
+        for ds, yhat in zip(forecast['ds'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist(), forecast['yhat'].tolist())
+    ]
+
+def _warm_forecaster():
+    """Fit a tiny dummy series so the first request doesn't pay the JIT compile."""
+    if FORECASTER != "statsforecast":
+        return
+    _fit(pd.DataFrame({
+        "ds": pd.date_range("2024-01-01", periods=2 * SEASON_LENGTH, freq="5min"),
+        "y": [float(i % SEASON_LENGTH) for i in range(2 * SEASON_LENGTH)]
+    })).predict(h=FORECAST_HORIZON)
+
+def _get_fit_pool():
+    global _fit_pool
+    if _fit_pool is None:
+        # Spawned, not forked: the server has threads, open connections and the
+        # YOLO model, none of which a worker should inherit. Each worker compiles
+        # (or loads from NUMBA_CACHE_DIR) once when it starts.
+        _fit_pool = ProcessPoolExecutor(
+            max_workers=FIT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_forecaster
+        )
+    return _fit_pool
+
+@router.on_event("startup")
+def _start_fit_pool():
+    pool = _get_fit_pool()
+    for _ in range(FIT_WORKERS):
+        pool.submit(int)  # spawn the workers now rather than on the first request
+
+@router.on_event("shutdown")
+def _stop_fit_pool():
+    global _fit_pool
+    if _fit_pool is not None:
+        _fit_pool.shutdown(wait=False, cancel_futures=True)
+        _fit_pool = None